@@ -1,12 +1,132 @@
 import re
+import asyncio
+import requests
+import threading
 import unicodedata
+from html import unescape
+from functools import lru_cache
 from PIL import Image
-from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 from pyzbar.pyzbar import decode
 from playwright.async_api import async_playwright
 from pdf2image import convert_from_bytes, convert_from_path
 from streamlit.runtime.uploaded_file_manager import UploadedFile
 
+# Se mantiene un solo navegador (y un solo contexto) vivo; lanzar Chromium en cada pdf
+# es lo que más tiempo toma. Compartir el contexto además reutiliza las cookies y la
+# sesión TLS con el SAT entre consultas.
+# Los objetos de Playwright no se pueden usar desde otro event loop, y streamlit llama
+# asyncio.run (un loop nuevo) en cada archivo, así que el navegador vive en su propio
+# loop en un hilo aparte y las consultas se mandan a ese loop.
+_BROWSER_LOOP = None
+_BROWSER_LOOP_LOCK = threading.Lock()
+_BROWSER_LOCK = None
+_PW = None
+_BROWSER = None
+_CONTEXT = None
+
+def _get_browser_loop() -> asyncio.AbstractEventLoop:
+    '''
+    Regresa el event loop del navegador, arrancando su hilo la primera vez que se necesita.
+    '''
+    global _BROWSER_LOOP
+    with _BROWSER_LOOP_LOCK:
+        if _BROWSER_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='csf-browser', daemon=True).start()
+            _BROWSER_LOOP = loop
+    return _BROWSER_LOOP
+
+async def _run_in_browser_loop(coro):
+    '''
+    Corre la corutina en el loop del navegador y espera su resultado sin bloquear el loop actual.
+    '''
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _get_browser_loop()))
+
+async def _get_context():
+    '''
+    Regresa el contexto compartido, lanzando el navegador la primera vez que se necesita.
+    Solo se debe llamar desde el loop del navegador.
+    '''
+    global _BROWSER_LOCK, _PW, _BROWSER, _CONTEXT
+    if _BROWSER_LOCK is None:
+        _BROWSER_LOCK = asyncio.Lock()
+    async with _BROWSER_LOCK:
+        if _BROWSER is None or not _BROWSER.is_connected():
+            if _PW is None:
+                _PW = await async_playwright().start()
+            _BROWSER = await _PW.chromium.launch(
+                headless=True,
+                args=['--disable-dev-shm-usage', '--no-sandbox']
+            )
+            _CONTEXT = None
+        if _CONTEXT is None:
+            _CONTEXT = await _BROWSER.new_context(
+                java_script_enabled=True,
+                viewport={'width': 800, 'height': 600}
+            )
+            # Solo necesitamos el DOM, así que no descargamos imágenes, estilos ni fuentes
+            await _CONTEXT.route('**/*', _block_heavy_resources)
+    return _CONTEXT
+
+async def _fetch_html(url: str) -> str:
+    '''
+    Abre la página en el contexto compartido y regresa el html ya con la tabla de datos.
+    Solo se debe llamar desde el loop del navegador.
+    '''
+    context = await _get_context()
+    page = await context.new_page()
+    try:
+        await page.goto(url, wait_until='commit')
+        await page.wait_for_selector('tr.ui-widget-content td', timeout=10_000)
+        return await page.content()
+    finally:
+        await page.close()
+
+async def _close_browser() -> None:
+    global _PW, _BROWSER, _CONTEXT
+    if _BROWSER_LOCK is None:
+        return
+    async with _BROWSER_LOCK:
+        if _CONTEXT is not None:
+            await _CONTEXT.close()
+            _CONTEXT = None
+        if _BROWSER is not None:
+            await _BROWSER.close()
+            _BROWSER = None
+        if _PW is not None:
+            await _PW.stop()
+            _PW = None
+
+async def aclose() -> None:
+    '''
+    Cierra el navegador compartido. Se debe llamar al terminar la aplicación; se puede
+    llamar desde cualquier event loop.
+    '''
+    if _BROWSER_LOOP is None:
+        return
+    await _run_in_browser_loop(_close_browser())
+
+_RFC_RE = re.compile(r'RFC:\s*((?:[A-ZÑ]|&amp;|&){3,4}\d{6}[A-Z0-9]{3})')
+_PUNCT_RE = re.compile(r'[\n_()\-:]+')
+_WS_RE = re.compile(r'\s+')
+
+@lru_cache(maxsize=None)
+def _combining_table() -> dict:
+    '''
+    Tabla para str.translate que elimina los caracteres combinables (acentos).
+    Se construye una sola vez, la primera vez que se necesita.
+    '''
+    return {c: None for c in range(0x110000) if unicodedata.combining(chr(c))}
+
+_BLOCKED_RESOURCES = {'image', 'stylesheet', 'font', 'media'}
+
+async def _block_heavy_resources(route) -> None:
+    if route.request.resource_type in _BLOCKED_RESOURCES:
+        await route.abort()
+    else:
+        await route.continue_()
+
 class InformationExtractor:
     '''
     Esta clase permite extraer la información de una constancia de situación
@@ -15,59 +135,94 @@ class InformationExtractor:
     '''
     def __init__(self) -> None:
         self.information = None
+        self.__session = requests.Session()
 
     async def process_pdf(self, pdf: UploadedFile, from_path: bool = False) -> dict:
         img = self.__convert_pdf_to_image(pdf, from_path=from_path)
         url = self.__get_url_from_csf(img)
-        html = await self.__get_html(url)
+        # Después de leer el QR ya no necesitamos la imagen, la liberamos antes de esperar el html
+        img.close()
+        del img
+        html = await self.__get_html_without_browser(url)
+        if html is None:
+            html = await self.__get_html(url)
         information = self.__extract_information(html)
         self.information = information
 
     def __eliminar_acentos(self, texto):
-        texto_normalizado = unicodedata.normalize('NFKD', texto)
-        texto_sin_acentos = ''.join(c for c in texto_normalizado if not unicodedata.combining(c))
-        return texto_sin_acentos
+        # La mayoría de las etiquetas ya son ascii y no tienen nada que normalizar
+        if texto.isascii(): return texto
+        return unicodedata.normalize('NFKD', texto).translate(_combining_table())
 
     def __clean_string(self, text: str) -> str:
-        text = re.sub(r'[\n_()\-:]+', ' ', text)
+        text = _PUNCT_RE.sub(' ', text)
         text = self.__eliminar_acentos(text)
-        text = re.sub(r'\s+', '_', text.strip().lower())
+        text = _WS_RE.sub('_', text.strip().lower())
         return text
 
     def __extract_information(self, html: str) -> dict:
-        soup = BeautifulSoup(html, 'lxml')
+        root = lxml_html.fromstring(html)
         values = {}
-        rfc = soup.find('li').text.split(':')[1].split(',')[0].strip()
+        rfc = self.extract_rfc(html)
+        if rfc is None:
+            rfc = root.xpath('string(//li)').split(':')[1].split(',')[0].strip()
         values['rfc'] = rfc
-        tds = soup.select("tr[class='ui-widget-content'] td")[1:]
+        tds = root.xpath("//tr[@class='ui-widget-content']//td")[1:]
         previous_span = ''
         for td in tds:
-            span = td.find('span')
-            if span:
-                previous_span = self.__clean_string(span.text)
+            span = td.find('.//span')
+            if span is not None:
+                previous_span = self.__clean_string(span.text_content())
             else:
-                value = td.text.strip() if td.text.strip() != '' else None
+                value = td.text_content().strip()
                 if value:
                     values[previous_span] = value
         return values
 
+    @staticmethod
+    def extract_rfc(html: str) -> str:
+        '''
+        Saca el RFC directamente del html sin tener que parsearlo.
+        Es útil cuando solo se necesita el RFC. Regresa None si no lo encuentra.
+        '''
+        match = _RFC_RE.search(html)
+        return unescape(match.group(1)) if match else None
+
     def __convert_pdf_to_image(self, pdf: UploadedFile, from_path: bool = False) -> Image:
         if from_path:
-            return convert_from_path(pdf, dpi=300)[0]
+            return convert_from_path(pdf, dpi=300, first_page=1, last_page=1, fmt='jpeg')[0]
         if not pdf.name.endswith('pdf'):
             raise ValueError('File format not supported')
         bytes_data = pdf.getvalue()
-        return convert_from_bytes(bytes_data, dpi=300)[0]
+        # Solo nos interesa la primera página, que es donde está el QR
+        return convert_from_bytes(bytes_data, dpi=300, first_page=1, last_page=1, fmt='jpeg')[0]
 
     def __get_url_from_csf(self, image: Image) -> str:
-        return decode(image)[0].data.decode('ascii')
+        # zbar solo usa la luminancia, así que le pasamos la imagen en escala de grises
+        # y a la mitad de resolución. Si así no encuentra el QR, se intenta con la original.
+        gray = image.convert('L')
+        small = gray.resize((gray.width // 2, gray.height // 2), Image.BILINEAR)
+        try:
+            codes = decode((small.tobytes(), small.width, small.height))
+            if not codes:
+                codes = decode((gray.tobytes(), gray.width, gray.height))
+        finally:
+            small.close()
+            gray.close()
+        return codes[0].data.decode('ascii')
+
+    async def __get_html_without_browser(self, url: str) -> str:
+        '''
+        Intenta obtener la página con un GET normal, que es mucho más ligero que levantar
+        Chromium. Si la respuesta no trae la tabla con los datos regresa None.
+        '''
+        try:
+            response = await asyncio.to_thread(self.__session.get, url, timeout=10)
+        except requests.RequestException:
+            return None
+        if response.ok and 'ui-widget-content' in response.text:
+            return response.text
+        return None
 
     async def __get_html(self, url: str) -> str:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context()
-            page = await context.new_page()
-            await page.goto(url, wait_until='domcontentloaded')
-            content = await page.content()
-            await browser.close()
-            return content
\ No newline at end of file
+        return await _run_in_browser_loop(_fetch_html(url))
\ No newline at end of file
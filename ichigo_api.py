@@ -1,14 +1,19 @@
 import os
 import re
 import math
-import json
+import time
+import numbers
+import orjson
 import gspread
 import requests
 import numpy as np
 import pandas as pd
 from typing import List, Dict
+from dataclasses import dataclass
 from datetime import datetime
 from requests import Response
+from urllib3.util.retry import Retry
+from requests.adapters import HTTPAdapter
 from fractions import Fraction
 from my_apis.sheets_functions import SheetsFunctions
 from my_apis.mb_connection import MetabaseConnection
@@ -16,7 +21,107 @@ from simple_salesforce import SalesforceResourceNotFound
 from my_apis.sf_connection import SalesforceConnection, SalesforceFunctions
 
 
+@dataclass(slots=True, frozen=True)
+class CreateMasterCodeInput:
+    """
+    Input of the createMasterCode mutation. Field names match the ones in Ichigo.
+    """
+    code:str
+    type:str
+    order:int
+    groupingCode:str='all'
+
+    def __post_init__(self):
+        if not self.code:
+            raise ValueError('Master code needs a code')
+        if not isinstance(self.order, numbers.Integral):
+            raise ValueError(f'Invalid order for master code: {self.order}')
+
+
+@dataclass(slots=True, frozen=True)
+class CreateItemInput:
+    """
+    Input of the createItemCatalog mutation. Field names match the ones in Ichigo.
+    """
+    classificationCode:str
+    materialCode:str
+    gradeCode:str
+    name:str
+    weight:float
+    dimensions:List[Dict]
+    presentationCode:str=None
+    finishCode:str=None
+    dimension:str='None'
+    overriteWeight:bool=True
+
+    def __post_init__(self):
+        if not self.name:
+            raise ValueError('Item needs a name')
+        if not isinstance(self.weight, numbers.Real):
+            raise ValueError(f'Invalid weight for item {self.name}: {self.weight}')
+        if not isinstance(self.dimensions, list):
+            raise ValueError(f'Dimensions for item {self.name} must be a list')
+
+
 class Ichigo:
+    # Equivalencia entre calibres (y cédulas) y su master code
+    _CAL_FWD = {
+        'Cal. 32': 90,
+        'Cal. 30': 120,
+        'Cal. 29': 135,
+        'Cal. 28': 149,
+        'Cal. 27': 164,
+        'Cal. 26': 179,
+        'Cal. 25': 209,
+        'Cal. 24': 239,
+        'Cal. 23': 269,
+        'Cal. 22': 299,
+        'Cal. 21': 329,
+        'Cal. 20': 359,
+        'Cal. 19': 418,
+        'Cal. 18': 478,
+        'Cal. 17': 538,
+        'Cal. 16': 598,
+        'Cal. 15': 673,
+        'Cal. 14': 747,
+        'Cal. 13': 897,
+        'Cal. 12': 1046,
+        'Cal. 11': 1196,
+        'Cal. 10': 1345,
+        'Cal. 9': 1495,
+        'Cal. 8': 1644,
+        'Cal. 7': 1443,
+        'Cal. 6': 1620,
+        'Cal. 5': 1819,
+        'Cal. 4': 2043,
+        'Cal. 3': 2294,
+        'XXS':1, # para cédulas
+        'X':5 # para cédulas
+    }
+    _CAL_REV = {value: key for key, value in _CAL_FWD.items()}
+    _FRAC_CLEAN_RE = re.compile(r"[^0-9/\. ]")
+
+    # Campos que se pueden pedir del catálogo de items
+    _ITEM_CATALOG_FIELDS = (
+        'id', 'erpId', 'name', 'sku', 'skuRmt', 'weight', 'unitCode', 'materialCode',
+        'classificationCode', 'gradeCode', 'presentationCode', 'finishCode', 'categoryCode',
+        'schedule', 'dimension', 'pricePerKg', 'dimensions'
+    )
+
+    # Dimensiones obligatorias de cada familia: (typeCode, parámetro con la medida, unidad)
+    # La unidad puede ser fija o el nombre del parámetro que la trae.
+    # Nota: cedula no es obligatorio para tuberia; se guarda en "Depth"
+    _THICKNESS = ('Thickness', 'thickness', None)
+    _LENGTH = ('Length', 'length_value', 'length_unit')
+    _FAMILY_DIMENSIONS = {
+        'plano': (_THICKNESS, ('Width', 'width_value', 'width_unit'), _LENGTH),
+        'perfil': (_THICKNESS, _LENGTH, ('Wall length', 'wall_length', 'Inch'), ('Wall width', 'wall_width', 'Inch')),
+        'polin': (_THICKNESS, _LENGTH, ('A', 'A', 'Inch'), ('B', 'B', 'Inch')),
+        'viga-canal': (_LENGTH, ('Kg/m', 'kg_m', None), ('Depth', 'depth', None)),
+        'largo-solido': (_THICKNESS, _LENGTH),
+        'tuberia': (_THICKNESS, _LENGTH, ('External diameter', 'diameter', 'Inch'), ('Nominal diameter', 'diameter', 'Inch'))
+    }
+
     def __init__(self, bearer_token:str, connect_to:str):
         """
         This function handles the necessary functionality to use Ichigo
@@ -40,6 +145,29 @@ class Ichigo:
             'content-type': 'application/json'
         }
 
+        # Todas las llamadas comparten la misma conexión para no pagar el handshake cada vez.
+        # Solo se reintentan los errores de conexión: todas las llamadas son POST (incluidas las
+        # mutaciones como create_item), y reintentarlas por status code podría duplicarlas
+        self.__session = requests.Session()
+        self.__session.headers.update(self.__headers)
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3)
+        )
+        self.__session.mount('https://', adapter)
+
+        # Cache de los master codes: {nombre: (momento en que se guardó, valor)}
+        self.__mc_cache = {}
+
+    def __post(self, json_data:Dict) -> Response:
+        """
+        Sends the GraphQL payload to the endpoint. The body is serialized with orjson,
+        which also handles the numpy values that come from DataFrames.
+        """
+        body = orjson.dumps(json_data, option=orjson.OPT_SERIALIZE_NUMPY)
+        return self.__session.post(self.__endpoint, data=body)
+
     def create_master_code(
         self,
         code:str, 
@@ -79,16 +207,18 @@ class Ichigo:
                 }
             """,
             'variables': {
-                'createMasterCode': {
-                    'code': code,
-                    'type': type_,
-                    'groupingCode': grouping_code,
-                    'order': order,
-                },
+                'createMasterCode': CreateMasterCodeInput(
+                    code=code,
+                    type=type_,
+                    order=order,
+                    groupingCode=grouping_code
+                ),
             },
             'operationName': 'CreateMasterCode',
         }
-        resp = requests.post(self.__endpoint, headers=self.__headers, json=json_data)
+        resp = self.__post(json_data)
+        # Los master codes cambiaron, así que lo que esté en cache ya no sirve
+        self.__mc_cache.clear()
         return resp
         
     def create_item(
@@ -133,23 +263,78 @@ class Ichigo:
                 }
             """,
             'variables': {
-                'createItemCatalogInput': {
-                    'classificationCode': classification,
-                    'materialCode': material,
-                    'gradeCode': grade,
-                    'presentationCode': presentation,
-                    'finishCode': finish,
-                    'name': name,
-                    'weight': weight,
-                    'overriteWeight': True,
-                    'dimensions': dimensions,
-                    'dimension':f'{dimension}'
-                },
+                'createItemCatalogInput': self.__build_item_input(
+                    name=name,
+                    weight=weight,
+                    material=material,
+                    classification=classification,
+                    grade=grade,
+                    dimensions=dimensions,
+                    presentation=presentation,
+                    finish=finish,
+                    dimension=dimension
+                ),
             },
             'operationName': 'CreateItemCatalog',
         }
-        response = requests.post(self.__endpoint, headers=self.__headers, json=json_data)
+        response = self.__post(json_data)
         return response
+
+    def create_items_bulk(
+        self,
+        items:List[Dict]
+    ) -> Response:
+        """
+        This function uploads several items to the catalogue in a single request.
+        Each item becomes an aliased mutation (item0, item1, ...) so the response
+        has one entry per item in the same order they were given.
+
+        :param items: list of dictionaries with the same parameters that create_item receives
+
+        :return: Response with the id and sku of every item created.
+        """
+        if not items:
+            raise ValueError('At least one item is needed')
+
+        params = ', '.join(f'$input{i}: CreateItemCatalogInput!' for i in range(len(items)))
+        mutations = '\n'.join(
+            f'item{i}: createItemCatalog(createItemCatalogInput: $input{i}) {{ id sku }}'
+            for i in range(len(items))
+        )
+        json_data = {
+            'query': f'mutation CreateItemsCatalog({params}) {{\n{mutations}\n}}',
+            'variables': {f'input{i}': self.__build_item_input(**item) for i, item in enumerate(items)},
+            'operationName': 'CreateItemsCatalog',
+        }
+        response = self.__post(json_data)
+        return response
+
+    def __build_item_input(
+        self,
+        name:str,
+        weight:float,
+        material:str,
+        classification:str,
+        grade:str,
+        dimensions:List[Dict],
+        presentation:str=None,
+        finish:str=None,
+        dimension:str=None
+    ) -> CreateItemInput:
+        """
+        Builds the CreateItemCatalogInput that Ichigo expects.
+        """
+        return CreateItemInput(
+            classificationCode=classification,
+            materialCode=material,
+            gradeCode=grade,
+            name=name,
+            weight=weight,
+            dimensions=dimensions,
+            presentationCode=presentation,
+            finishCode=finish,
+            dimension=f'{dimension}'
+        )
         
     def remove_item_catalogue(
         self,
@@ -176,18 +361,24 @@ class Ichigo:
             'operationName': 'RemoveItemCatalog',
         }
         
-        response = requests.post(self.__endpoint, headers=self.__headers, json=json_data)
+        response = self.__post(json_data)
         return response
         
     def get_master_code_types(
-        self
+        self,
+        ttl:float=60
     ) -> Dict:
         """
         This function retrieves not only the available master codes that are important
         for RawMaterials, but it also gives the available options that each one of them has.
 
+        :param ttl: seconds that a previous result is reused before asking Ichigo again
+
         :return: dictionary with structure {'master_code_type':[options]}
         """
+        cached = self.__get_cached('master_code_types', ttl)
+        if cached is not None: return cached
+
         query = """
         query MasterCodes {
         masterCodes {
@@ -196,31 +387,26 @@ class Ichigo:
         }
         }
         """
-        response = requests.post(
-            self.__endpoint, 
-            headers=self.__headers, 
-            json={'query':query}
-        )
-        aux_dict = (
-            pd
-            .DataFrame(json.loads(response.text)['data']['masterCodes'])
-            .query('type.str.startswith("RawMaterial")')
-            .groupby('type')
-            .agg(options=pd.NamedAgg('code', list))
-            .transpose()
-            .to_dict()
-        )
+        response = self.__post({'query':query})
         mc = {}
-        for k, v in aux_dict.items():
-            mc[k] = v['options']
-        return mc
+        for master_code in orjson.loads(response.content)['data']['masterCodes']:
+            type_ = master_code['type']
+            if type_.startswith('RawMaterial'):
+                mc.setdefault(type_, []).append(master_code['code'])
+        return self.__set_cached('master_code_types', dict(sorted(mc.items())))
         
     def get_max_order_master_codes(
-        self
+        self,
+        ttl:float=60
     ) -> Dict:
         """
         Extract the max order of each value of the master codes.
+
+        :param ttl: seconds that a previous result is reused before asking Ichigo again
         """
+        cached = self.__get_cached('max_order_master_codes', ttl)
+        if cached is not None: return cached
+
         query = """
         query MasterCodes {
         masterCodes {
@@ -232,25 +418,30 @@ class Ichigo:
         }
         }
         """
-        response = requests.post(
-            self.__endpoint, 
-            headers=self.__headers, 
-            json={'query':query}
-        )
-        
-        max_orders = (
-            pd
-            .DataFrame(json.loads(response.text)['data']['masterCodes'])
-            .groupby('type')
-            .agg(max_order=pd.NamedAgg('order', 'max'))
-            .reset_index()
-            .query('type.str.startswith("RawMaterial")')
-            .set_index('type')
-            .to_dict()
-            ['max_order']
-        )
+        response = self.__post({'query':query})
+
+        max_orders = {}
+        for master_code in orjson.loads(response.content)['data']['masterCodes']:
+            type_, order = master_code['type'], master_code['order']
+            if not type_.startswith('RawMaterial') or order is None:
+                continue
+            if type_ not in max_orders or order > max_orders[type_]:
+                max_orders[type_] = order
 
-        return max_orders
+        return self.__set_cached('max_order_master_codes', dict(sorted(max_orders.items())))
+
+    def __get_cached(self, key:str, ttl:float):
+        """
+        Returns the cached value if it is younger than ttl seconds, otherwise None.
+        """
+        cached = self.__mc_cache.get(key)
+        if cached is None or time.monotonic() - cached[0] >= ttl:
+            return None
+        return cached[1]
+
+    def __set_cached(self, key:str, value):
+        self.__mc_cache[key] = (time.monotonic(), value)
+        return value
         
     def map_width_to_master_code(
         self,
@@ -261,7 +452,7 @@ class Ichigo:
         """
         Calibres y espesores en mastercodes tienen un código numérico.
         Su equivalencia es especialemente difícil de inferir cuando 
-        corresponden a calibres, por lo tanto, aquí se tiene una tabla
+        corresponden a calibres, por lo tanto, se usa la tabla _CAL_FWD
         que mapea el valor de los espesores a su equivalencia numérica.
 
         :param width: espesor o calibre, pueden ser como "1
@@ -269,63 +460,15 @@ class Ichigo:
             | es útil cuando se sabe que no hay número en width y solo se quiere encontrar la equivalencia del diccionario
         :param inverse: if True, returnsn the original width instead of the master code
         """ 
-        equivalencias_calibres = {
-            'Cal. 32': 90,
-            'Cal. 30': 120,
-            'Cal. 29': 135,
-            'Cal. 28': 149,
-            'Cal. 27': 164,
-            'Cal. 26': 179,
-            'Cal. 25': 209,
-            'Cal. 24': 239,
-            'Cal. 23': 269,
-            'Cal. 22': 299,
-            'Cal. 21': 329,
-            'Cal. 20': 359,
-            'Cal. 19': 418,
-            'Cal. 18': 478,
-            'Cal. 17': 538,
-            'Cal. 16': 598,
-            'Cal. 15': 673,
-            'Cal. 14': 747,
-            'Cal. 13': 897,
-            'Cal. 12': 1046,
-            'Cal. 11': 1196,
-            'Cal. 10': 1345,
-            'Cal. 9': 1495,
-            'Cal. 8': 1644,
-            'Cal. 7': 1443,
-            'Cal. 6': 1620,
-            'Cal. 5': 1819,
-            'Cal. 4': 2043,
-            'Cal. 3': 2294,
-            'XXS':1, # para cédulas
-            'X':5 # para cédulas
-        }
-
-        def get_key(val):
-            for key, value in equivalencias_calibres.items():
-                if val == value:
-                    return key
-            return val / 10_000
-        
         if inverse:
             if type(width) != int:
                 raise ValueError('Invalid value for master code')
-            return get_key(width)
-        
-        def __fraction_to_float(original_value:str) -> str:
-            value = str(original_value)
-            value = value.lower().replace('-', ' ')
-            if 'c' in value: return original_value # para evitar limpiar calibres
-            value = re.sub(r"[^0-9/\. ]", "", value).strip()
-            fractions = [float(Fraction(frac)) for frac in value.split(' ')]
-            return int(sum(fractions) * 10_000)
-            
+            return self._CAL_REV.get(width, width / 10_000)
+
         if skip_conversion:
             master_code = width
         else:
-            master_code = __fraction_to_float(width)
+            master_code = self._fraction_to_float(width)
         
         # Si el master_code es igual al width es porque corresponde a un calibre
         # Y por lo tanto, hacer la conversión tal cual no va a funcionar.
@@ -334,9 +477,60 @@ class Ichigo:
         # Si estamos aquí, significa que width es un calibre.
         # Hay que hacer uso de tabla de conversión.
         
-        if width not in equivalencias_calibres:
+        if width not in self._CAL_FWD:
             raise ValueError(f"Invalid value for width: {width}")
-        return equivalencias_calibres[width]
+        return self._CAL_FWD[width]
+
+    def map_widths_vec(
+        self,
+        widths:pd.Series
+    ) -> pd.Series:
+        """
+        Versión vectorizada de map_width_to_master_code para una columna completa
+        de espesores o calibres (eg. al cargar un catálogo desde un DataFrame).
+        Cada valor distinto se convierte una sola vez.
+
+        :param widths: serie con espesores o calibres
+        :return: serie con los master codes, con el mismo índice que widths
+        """
+        # Los valores vacíos no se pueden convertir, igual que en _fraction_to_float
+        missing = widths.isna()
+        if missing.any():
+            raise ValueError(f"Invalid value for width: {widths[missing].iloc[0]}")
+
+        lowered = widths.astype(str).str.lower().str.replace('-', ' ', regex=False)
+        # Igual que en map_width_to_master_code, si trae una c es un calibre
+        is_caliber = lowered.str.contains('c', regex=False)
+        unknown = is_caliber & ~widths.isin(self._CAL_FWD.keys())
+        if unknown.any():
+            raise ValueError(f"Invalid value for width: {widths[unknown].iloc[0]}")
+
+        master_codes = pd.Series(0, index=widths.index, dtype='int64')
+        master_codes[is_caliber] = widths[is_caliber].map(self._CAL_FWD)
+
+        rest = lowered[~is_caliber].str.replace(self._FRAC_CLEAN_RE.pattern, '', regex=True).str.strip()
+        empty = rest == ''
+        if empty.any():
+            raise ValueError(f"Invalid value for width: {widths[empty[empty].index[0]]}")
+        parsed = {
+            value: int(sum(float(Fraction(frac)) for frac in value.split()) * 10_000)
+            for value in rest.unique()
+        }
+        master_codes[~is_caliber] = rest.map(parsed)
+        return master_codes
+
+    @staticmethod
+    def _fraction_to_float(original_value:str) -> int|str:
+        """
+        Convierte un espesor como "1-1/2" a su master code (1.5 * 10_000).
+        Si es un calibre se regresa tal cual. Levanta ValueError si no trae ningún número.
+        """
+        value = str(original_value).lower().replace('-', ' ')
+        if 'c' in value: return original_value # para evitar limpiar calibres
+        value = Ichigo._FRAC_CLEAN_RE.sub("", value).strip()
+        # Sin números (eg. '', NaN o una cédula como 'XXS') no hay espesor que convertir
+        if not value: raise ValueError(f"Invalid value for width: {original_value}")
+        return int(sum(float(Fraction(frac)) for frac in value.split()) * 10_000)
     
     def load_items_catalog(
         self
@@ -345,39 +539,40 @@ class Ichigo:
         This function extracts the items from ichigo.
         It is better than going to Metabase because the other one doesn't work basically.
         """
+        return pd.DataFrame(self.load_items_catalog_raw(self._ITEM_CATALOG_FIELDS)).infer_objects()
+
+    def load_items_catalog_raw(
+        self,
+        fields:tuple=('id', 'sku', 'name')
+    ) -> Dict[str, np.ndarray]:
+        """
+        Lighter version of load_items_catalog. Only the requested fields are asked
+        to Ichigo and they are returned as one array per field, which is enough
+        when the catalogue is only used as a lookup table.
+
+        :param fields: fields of the items to extract, must be in _ITEM_CATALOG_FIELDS
+
+        :return: dictionary with structure {'field':np.ndarray}
+        """
+        invalid_fields = set(fields) - set(self._ITEM_CATALOG_FIELDS)
+        if invalid_fields:
+            raise ValueError(f'Invalid fields: {invalid_fields}')
+
+        selection = '\n'.join(
+            'dimensions { typeCode unitCode measure }' if field == 'dimensions' else field
+            for field in fields
+        )
         json_data = {
-            'query': """
-                query ItemsCatalog {
-                itemsCatalog {
-                    id
-                    erpId
-                    name
-                    sku
-                    skuRmt
-                    weight
-                    unitCode
-                    materialCode
-                    classificationCode
-                    gradeCode
-                    presentationCode
-                    finishCode
-                    categoryCode
-                    schedule
-                    dimension
-                    pricePerKg
-                    dimensions {
-                    typeCode
-                    unitCode
-                    measure
-                    }
-                }
-                }
-            """,
+            'query': f'query ItemsCatalog {{\nitemsCatalog {{\n{selection}\n}}\n}}',
             'variables': {},
             'operationName': 'ItemsCatalog',
         }
-        response = requests.post(self.__endpoint, headers=self.__headers, json=json_data)
-        return pd.DataFrame(json.loads(response.text)['data']['itemsCatalog'])
+        response = self.__post(json_data)
+        items = orjson.loads(response.content)['data']['itemsCatalog']
+        return {
+            field: np.fromiter((item[field] for item in items), dtype=object, count=len(items))
+            for field in fields
+        }
 
     def build_dimensions(
         self,
@@ -405,50 +600,24 @@ class Ichigo:
         :param family: what type of item it is, to ensure that the necessary values are available
         :return: list of dictionary ready to send to Ichigo
         """
-        necessary_values = {
-            'plano':[thickness, width_unit, width_value, length_unit, length_value],
-            'perfil':[thickness, wall_length, wall_width, length_unit, length_value],
-            'polin':[thickness, length_unit, length_value, A, B],
-            'viga-canal':[length_unit, length_value, kg_m, depth],
-            'largo-solido':[thickness, length_unit, length_value],
-            'tuberia':[thickness, length_unit, length_value, diameter] # Nota: cedula no es obligatorio; se guarda en "Depth"
-        }
-        
-        def validate_inputs() -> bool:
-            no_none = [value for value in necessary_values[family] if value not in (None, np.nan)]
-            return len(no_none) == len(necessary_values[family])
+        if family not in self._FAMILY_DIMENSIONS:
+            raise ValueError(f'Invalid family: {family}')
+
+        params = locals()
+        specs = self._FAMILY_DIMENSIONS[family]
 
-        if not validate_inputs():
+        # Todos los valores (y unidades) que pide la familia deben venir
+        necessary_values = [params[value_key] for _, value_key, _ in specs]
+        necessary_values += [params[unit] for _, _, unit in specs if unit in params]
+        if any(self.__is_missing(value) for value in necessary_values):
             raise ValueError('Unable to build dimensions with inputs')
 
         dimensions = []
-        if thickness and thickness in necessary_values[family]:
-            dimension = {'typeCode': 'Thickness', 'unitCode': None, 'measure': self.map_width_to_master_code(thickness)}
-            dimensions.append(dimension)
-
-        if width_value and width_value in necessary_values[family]:
-            dimension = {'typeCode': 'Width', 'unitCode': width_unit, 'measure': width_value}
-            dimensions.append(dimension)
-
-        if length_value and length_value in necessary_values[family]:
-            dimension = {'typeCode': 'Length', 'unitCode': length_unit, 'measure': length_value}
-            dimensions.append(dimension)
-
-        if wall_length and wall_length in necessary_values[family]:
-            dimension = {'typeCode': 'Wall length', 'unitCode': 'Inch', 'measure': wall_length}
-            dimensions.append(dimension)
-            
-        if wall_width and wall_width in necessary_values[family]:
-            dimension = {'typeCode': 'Wall width', 'unitCode': 'Inch', 'measure': wall_width}
-            dimensions.append(dimension)
-
-        if A and A in necessary_values[family]:
-            dimension = {'typeCode': 'A', 'unitCode': 'Inch', 'measure': A}
-            dimensions.append(dimension)
-
-        if B and B in necessary_values[family]:
-            dimension = {'typeCode': 'B', 'unitCode': 'Inch', 'measure': B}
-            dimensions.append(dimension)
+        for type_code, value_key, unit in specs:
+            measure = params[value_key]
+            if value_key == 'thickness':
+                measure = self.map_width_to_master_code(measure)
+            dimensions.append({'typeCode': type_code, 'unitCode': params.get(unit, unit), 'measure': measure})
 
         if C and not math.isnan(C):
             dimension = {'typeCode': 'C', 'unitCode': 'Inch', 'measure': C}
@@ -458,20 +627,6 @@ class Ichigo:
             dimension = {'typeCode': 'D', 'unitCode': 'Inch', 'measure': D}
             dimensions.append(dimension)
 
-        if kg_m and kg_m in necessary_values[family]:
-            dimension = {'typeCode': 'Kg/m', 'unitCode': None, 'measure': kg_m}
-            dimensions.append(dimension)
-
-        if depth and kg_m in necessary_values[family]:
-            dimension = {'typeCode': 'Depth', 'unitCode': None, 'measure': depth}
-            dimensions.append(dimension)
-
-        if diameter and diameter in necessary_values[family]:
-            dimension = {'typeCode': 'External diameter', 'unitCode': 'Inch', 'measure': diameter}
-            dimensions.append(dimension)
-            dimension = {'typeCode': 'Nominal diameter', 'unitCode': 'Inch', 'measure': diameter}
-            dimensions.append(dimension)
-
         if cedula:
             try:
                 float(cedula) # si se puede convertir la dejamos en Depth
@@ -485,6 +640,10 @@ class Ichigo:
             
         return dimensions
     
+    @staticmethod
+    def __is_missing(value) -> bool:
+        return value is None or (isinstance(value, float) and math.isnan(value))
+
     def update_item(
         self,
         item_id:int,
@@ -514,5 +673,5 @@ class Ichigo:
             'operationName': 'UpdateItemCatalog',
         }
         
-        response = requests.post(self.__endpoint, headers=self.__headers, json=json_data)
+        response = self.__post(json_data)
         return response
\ No newline at end of file
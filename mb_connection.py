@@ -1,7 +1,28 @@
+import os
 import json
+import time
+import ijson
+import orjson
+import tempfile
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 import requests
+import numpy as np
 import pandas as pd
+from requests.adapters import HTTPAdapter
+
+class _ColumnSink:
+    '''
+    Recibe las filas que va leyendo ijson y las guarda como una lista por columna.
+    '''
+    def __init__(self) -> None:
+        self.data = []
+
+    def send(self, row:list) -> None:
+        if not self.data:
+            self.data = [[] for _ in row]
+        for column, value in zip(self.data, row):
+            column.append(value)
 
 class MetabaseConnection:
     def __init__(self, login_credentials, new_login:bool=False) -> None:
@@ -20,42 +41,72 @@ class MetabaseConnection:
             login_is_path = False
 
         self.METABASE_DOMAIN = login_info['metabase_domain']
+
+        # Una sola sesión para todas las llamadas, así se reutilizan las conexiones
+        self.__session = requests.Session()
+        self.__session.mount(self.METABASE_DOMAIN, HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
         use_api_key = 'api_key' in login_info.keys()
 
         if use_api_key:
             self.SESSION_ID = login_info['api_key']
             self.headers = {'x-api-key':self.SESSION_ID}
         else:
-            self.SESSION_ID=self.__get_session_token(login_credentials, new_login, login_is_path)
+            self.SESSION_ID=self.__get_session_token(login_info, login_credentials, new_login, login_is_path)
             self.headers = {'X-Metabase-Session': self.SESSION_ID}
 
-    def __get_session_token(self, login_credentials, new_login:bool, login_is_path:bool):
+        self.__session.headers.update(self.headers)
+
+        # Metadata por database_id: {database_id: (momento en que se guardó, metadata)}
+        self.__metadata_cache = {}
+        self.__db_id_by_name = {}
+
+    def close(self) -> None:
         '''
-        Esta función obtiene el session token.
+        Cierra las conexiones abiertas con Metabase.
         '''
-        if login_is_path:
-            with open(login_credentials, 'r') as f:
-                login_info = json.load(f)
-        else:
-            login_info = login_credentials
+        self.__session.close()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __get_session_token(self, login_info:dict, login_credentials, new_login:bool, login_is_path:bool):
+        '''
+        Esta función obtiene el session token.
+
+        :param login_info: las credenciales ya leídas
+        :param login_credentials: el path de donde se leyeron (si login_is_path), para guardar el nuevo token
+        '''
         if not new_login: return login_info["current-token"]    
 
         username = login_info["username"]
         password = login_info["password"]
         
-        session_id = requests.post(
+        session_id = self.__session.post(
             f'{self.METABASE_DOMAIN}/api/session',
             json={
                 'username': username, 'password': password
             }
         ).json()['id']
 
+        if login_info.get('current-token') == session_id: return session_id
+
         # Sobreescribmos el json con el nuevo token
         login_info['current-token'] = session_id
         if login_is_path:
-            with open(login_credentials, 'w') as file:
-                json.dump(login_info, file)
+            # Se escribe a un archivo temporal y luego se reemplaza, así si algo falla
+            # a la mitad no se quedan corruptas las credenciales
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(login_credentials)))
+            try:
+                with os.fdopen(fd, 'w') as file:
+                    json.dump(login_info, file)
+                os.replace(tmp_path, login_credentials)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
             
         return session_id
 
@@ -66,29 +117,43 @@ class MetabaseConnection:
         :param database_name: El nombre de la base de datos a buscar.
         :return: El ID de la base de datos si se encuentra, de lo contrario None.
         '''
-        json_data = requests.get(
-            url=f'{self.METABASE_DOMAIN}/api/database',
-            headers=self.headers
-        ).json()
+        # Solo se vuelve a pedir la lista si no conocemos el nombre (puede ser una base nueva)
+        if database_name in self.__db_id_by_name:
+            return self.__db_id_by_name[database_name]
 
-        # Iterar sobre cada base de datos en la lista
+        json_data = orjson.loads(self.__session.get(
+            url=f'{self.METABASE_DOMAIN}/api/database'
+        ).content)
+
+        self.__db_id_by_name = {}
         for db in json_data['data']:
-            # Verificar si el nombre de la base de datos coincide
-            if db['name'] == database_name:
-                # Devolver el ID de la base de datos
-                return db['id']
+            self.__db_id_by_name.setdefault(db['name'], db['id'])
         # Si no se encuentra la base de datos, devolver None
-        return None
+        return self.__db_id_by_name.get(database_name)
     
-    def __create_dataframe_from_json(self, json_data) -> pd.DataFrame:
+    def __create_dataframe_from_response(self, response:requests.Response) -> pd.DataFrame:
         '''
-        Función que limpia el json y regresa el dataframe limpio.
+        Función que lee el json de la respuesta por partes y regresa el dataframe limpio.
+        Las filas se van acomodando directamente por columnas conforme llegan, así nunca
+        se tiene en memoria el json completo ni la lista de filas.
         '''
-        # Extraemos las filas y los nombres de las columnas
-        rows = json_data['data']['rows']
-        cols = [col['display_name'] for col in json_data['data']['cols']]
-
-        return pd.DataFrame(rows, columns=cols)
+        columns = _ColumnSink()
+        cols = ijson.sendable_list()
+        rows_coro = ijson.items_coro(columns, 'data.rows.item', use_float=True)
+        cols_coro = ijson.items_coro(cols, 'data.cols.item', use_float=True)
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            rows_coro.send(chunk)
+            cols_coro.send(chunk)
+        rows_coro.close()
+        cols_coro.close()
+
+        names = [col['display_name'] for col in cols]
+        if not columns.data: return pd.DataFrame(columns=names)
+
+        # Se usan posiciones como llaves porque los nombres de las columnas se pueden repetir.
+        df = pd.DataFrame(dict(enumerate(columns.data)))
+        df.columns = names
+        return df
     
     def query_data(self, query:str, database_id:int=6, supress_warning:bool=False) -> pd.DataFrame:
         '''
@@ -98,21 +163,24 @@ class MetabaseConnection:
         :param database_id: el id del database que se va a usar. El default de Prima DWH es 6.
 
         En caso de querer usar otra database existe la función get_database_id() para encontrarlo.
+        Si el resultado llegó al límite de 2,000 registros, df.attrs['truncated'] es True; así se puede
+        decidir si usar query_more_data sin depender de capturar el warning.
         '''
-        json_data = requests.post(
+        response = self.__session.post(
             url=f'{self.METABASE_DOMAIN}/api/dataset',
-            headers=self.headers,
             json={
                 'database':database_id,
                 'type':'native',
                 'native':{
                     'query':query
                 }
-            }
-        ).json()
-
-        df = self.__create_dataframe_from_json(json_data)
-        if df.shape[0] == 2_000 and not supress_warning:
+            },
+            stream=True
+        )
+        with response:
+            df = self.__create_dataframe_from_response(response)
+        df.attrs['truncated'] = df.shape[0] == 2_000
+        if df.attrs['truncated'] and not supress_warning:
             warning_message = '''
     
                 WARNING: your query might have more records than what you are seeing. Limit is 2,000
@@ -163,9 +231,13 @@ class MetabaseConnection:
         :param order_by_clause: el string que viene en el query especificando dónde se pondrá el order by clase
         '''
         if id_col_df is None: id_col_df = id_col
-        data_list = []
         max_value = min_value
 
+        # Guardamos cada página como un arreglo por columna (por posición, pues los
+        # nombres se pueden repetir) y armamos el DataFrame una sola vez al final
+        names = None
+        col_buffers = None
+
         i = 0
         while 1:
             # print(i)
@@ -177,27 +249,134 @@ class MetabaseConnection:
             data = self.query_data(new_query, supress_warning=True, database_id=database_id)
                 
             max_value = data[id_col_df].max()
-            data_list.append(data)
-
-            if data.shape[0] < 2_000: 
+            if names is None:
+                names = list(data.columns)
+                col_buffers = [[] for _ in names]
+                empty_page = data
+            # Las páginas vacías no se agregan, su dtype object arruinaría el de las columnas
+            if data.shape[0] > 0:
+                for buffer, (_, column) in zip(col_buffers, data.items()):
+                    buffer.append(column.to_numpy())
+            is_last_page = data.shape[0] < 2_000
+            data = None
+
+            if is_last_page: 
                 break
             
             # print(max_value)
             i += 1
 
-        return pd.concat(data_list, ignore_index=True)
+        if not col_buffers or not col_buffers[0]: return empty_page
+
+        output = pd.DataFrame({i: np.concatenate(buffer) for i, buffer in enumerate(col_buffers)}, copy=False)
+        output.columns = names
+        return output
+
+    def query_more_data_parallel(self, query:str, id_col:str, id_col_df:str=None, database_id:int=6, n_workers:int=8, where_clause:str='--insert_where_clause_here', order_by_clause:str='--insert_order_by_clause_here') -> pd.DataFrame:
+        '''
+        Igual que query_more_data, pero primero busca el mínimo y máximo de id_col,
+        divide ese rango en n_workers ventanas y las extrae al mismo tiempo.
+        Si una ventana tiene más de 2000 registros se pagina dentro de ella.
+
+        :param query: el query que se buscará, debe tener el formato de dónde se incluirá el where y el order by
+        :param id_col: la columna que funciona como identificador, debe ser numérica y única
+        :param id_col_df: el nombre de la columna al extraer los datos, si es distinto de id_col
+        :param n_workers: el número de ventanas (y de requests simultáneos)
+        :param where_clause: el string que viene en el query especificando dónde se pondrá el where clause
+        :param order_by_clause: el string que viene en el query especificando dónde se pondrá el order by clase
+        '''
+        if id_col_df is None: id_col_df = id_col
+        if n_workers < 1: n_workers = 1
+
+        # Primero sacamos el rango de ids
+        inner_query = query.replace(where_clause, '').replace(order_by_clause, '')
+        bounds = self.query_data(
+            f'select min({id_col}) as lo, max({id_col}) as hi from (\n{inner_query}\n) as t',
+            supress_warning=True,
+            database_id=database_id
+        )
+        lo, hi = bounds.iloc[0, 0], bounds.iloc[0, 1]
+        if lo is None or pd.isna(lo):
+            # No hay registros, regresamos el frame vacío con sus columnas
+            empty_query = query.replace(where_clause, 'where 1 = 0').replace(order_by_clause, '')
+            return self.query_data(empty_query, supress_warning=True, database_id=database_id)
+
+        step = (hi - lo) / n_workers
+        edges = [lo + step * i for i in range(n_workers)] + [hi]
+        windows = [(edges[i], edges[i + 1], i == n_workers - 1) for i in range(n_workers)]
+
+        def query_window(window) -> pd.DataFrame:
+            start, end, is_last = window
+            upper = f"{id_col} <= {end}" if is_last else f"{id_col} < {end}"
+            lower = f"{id_col} >= {start}"
+            data_list = []
+            while 1:
+                new_query = (
+                    query
+                    .replace(where_clause, f"where {lower} and {upper}")
+                    .replace(order_by_clause, f'order by {id_col}')
+                )
+                data = self.query_data(new_query, supress_warning=True, database_id=database_id)
+                data_list.append(data)
+                if data.shape[0] < 2_000:
+                    break
+                lower = f"{id_col} > {data[id_col_df].max()}"
+            return pd.concat(data_list, ignore_index=True)
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            frames = list(executor.map(query_window, windows))
+
+        return pd.concat(frames, ignore_index=True, copy=False)
         
     
-    def __get_database_metadata(self, database_id:int):
+    def __get_database_metadata(self, database_id:int, ttl:float=300):
         '''
         Esta función regresa la metadata de la base de datos especificada.
+        La metadata se guarda por ttl segundos para no volver a pedirla en cada llamada.
         '''
-        db_metadata = requests.get(
-            url=f'{self.METABASE_DOMAIN}/api/database/{database_id}/metadata',
-            headers=self.headers
-        ).json()  
+        return self.__get_cached_metadata(database_id, ttl)[1]
 
-        return db_metadata
+    def __get_tables_by_name(self, database_id:int, ttl:float=300) -> dict:
+        '''
+        Regresa las tablas de la base de datos indexadas por nombre: {table_name:table}.
+        Se construye una sola vez por cada metadata que se descarga.
+        '''
+        return self.__get_cached_metadata(database_id, ttl)[2]
+
+    def __get_cached_metadata(self, database_id:int, ttl:float) -> tuple:
+        '''
+        Regresa (momento en que se guardó, metadata, tablas por nombre), pidiéndolo
+        a Metabase solo si no se tiene o ya pasaron más de ttl segundos.
+        '''
+        cached = self.__metadata_cache.get(database_id)
+        if cached is not None and time.monotonic() - cached[0] < ttl:
+            return cached
+
+        # La metadata de una base con muchas tablas puede pesar varios MB, orjson la lee mucho más rápido
+        db_metadata = orjson.loads(self.__session.get(
+            url=f'{self.METABASE_DOMAIN}/api/database/{database_id}/metadata'
+        ).content)
+
+        # Si hay nombres repetidos nos quedamos con la primera tabla, como antes
+        tables_by_name = {}
+        for table in db_metadata['tables']:
+            tables_by_name.setdefault(table['name'], table)
+
+        cached = (time.monotonic(), db_metadata, tables_by_name)
+        self.__metadata_cache[database_id] = cached
+        return cached
+
+    def invalidate_metadata(self, database_id:int=None) -> None:
+        '''
+        Borra la metadata guardada para que se vuelva a pedir a Metabase.
+        Útil cuando se sabe que cambió el esquema de la base de datos.
+
+        :param database_id: la base de datos a borrar; si es None se borran todas
+        '''
+        if database_id is None:
+            self.__metadata_cache.clear()
+        else:
+            self.__metadata_cache.pop(database_id, None)
     
     def get_tables_in_database(self, database_id:int=6, as_list:bool=False):
         '''
@@ -225,18 +404,11 @@ class MetabaseConnection:
 
         :return: lista, pd.DataFrame o None si la tabla no está en la base de datos
         '''
-        db_metadata = self.__get_database_metadata(database_id) 
-        tables = db_metadata['tables']
-
-        fields = None
-
-        for table in tables:
-            if table['name'] == table_name:
-                fields = table['fields']
-                break
+        table = self.__get_tables_by_name(database_id).get(table_name)
 
-        # Si fields sigue siendo None significa que el nombre de la tabla no existe
-        if fields is None: return None
+        # Si no está la tabla significa que el nombre de la tabla no existe
+        if table is None: return None
+        fields = table['fields']
 
         if include_type:
             data = [(field['name'], field['database_type']) for field in fields]
@@ -257,14 +429,9 @@ class MetabaseConnection:
         :param database_id: id de la base de datos donde está la tabla
         :return: el id de la tabla; None si no se encontró.
         '''
-        db_metadata = self.__get_database_metadata(database_id) 
-        tables = db_metadata['tables']
-
-        for table in tables:
-            if table['name'] == table_name:
-                return table['id']
-            
-        return None
+        table = self.__get_tables_by_name(database_id).get(table_name)
+        if table is None: return None
+        return table['id']
         
 
 if __name__ == '__main__':
@@ -1,10 +1,48 @@
+import io
+import os
+import csv
 import re
-import json
-import collections
+import time
+import orjson
+import tempfile
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from urllib3.util.retry import Retry
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from simple_salesforce import Salesforce, SFType, SalesforceLogin
 from simple_salesforce.exceptions import SalesforceMalformedRequest, SalesforceResourceNotFound
 
+_SF_SUFFIX_RE = re.compile(r'(__s$|__c$)')
+
+def _normalize_sf_name(name:str) -> str:
+    '''Quita los sufijos __c/__s de Salesforce y deja el nombre en minúsculas con un solo guion bajo'''
+    return _SF_SUFFIX_RE.sub('', name.lower()).replace('__', '_')
+
+def _esc(value) -> str:
+    '''Escapa un literal para ponerlo entre comillas simples en SOQL'''
+    return str(value).replace('\\', '\\\\').replace("'", "\\'")
+
+def _is_nan(value) -> bool:
+    '''True si el valor es NaN, la marca de celda vacía de pandas (None no cuenta)'''
+    return isinstance(value, float) and value != value
+
+def _read_bulk_page(page:str) -> pd.DataFrame:
+    '''
+    Parsea una página csv de la Bulk API con pyarrow, con todas las columnas como texto para no
+    perder ceros a la izquierda (códigos postales, teléfonos, ids externos). Las celdas vacías quedan como NaN.
+    '''
+    # pyarrow infiere los tipos antes de aplicar un dtype, así que se le dan los tipos por nombre de columna
+    names = next(csv.reader(io.StringIO(page)))
+    table = pa_csv.read_csv(
+        io.BytesIO(page.encode()),
+        convert_options=pa_csv.ConvertOptions(column_types=dict.fromkeys(names, pa.string()), strings_can_be_null=True)
+    )
+    df = table.to_pandas()
+    return df.where(df.notna(), np.nan)
+
 class SalesforceConnection:
     def __init__(self, login_info) -> None:
         """
@@ -12,11 +50,9 @@ class SalesforceConnection:
         """
         # Se tienen los datos para hacer login
         # Y hay dos opciones: nos dan [usuario, contraseña, token] o nos dan [session_id e instance]
-        try:
-            with open(login_info, 'r') as f:
-                login_info = json.load(f)
-        except:
-            pass
+        if isinstance(login_info, (str, os.PathLike)):
+            with open(login_info, 'rb') as f:
+                login_info = orjson.loads(f.read())
 
         credentials_login = 'password' in login_info.keys()
 
@@ -26,6 +62,20 @@ class SalesforceConnection:
             self.__session_id = login_info["session_id"]
             self.__instance = login_info["instance"]
             self.__sf = Salesforce(**login_info)
+
+        # Pool de conexiones persistentes para los lotes en paralelo (pool_maxsize >= max_workers).
+        # Urllib3 no reintenta POST/PATCH por defecto, así que los reintentos no duplican registros
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        )
+        self.__sf.session.mount('https://', adapter)
+
+        # describe() de cada objeto: {object_type: (momento en que se guardó, describe)}
+        self.__describe_cache = {}
+        # SFType de cada objeto, para no construirlo en cada llamada: {object_type: SFType}
+        self.__sftypes = {}
             
     def __create_salesforce_connection(self, username:str, password:str, security_token:str, domain:str):
         """
@@ -35,18 +85,55 @@ class SalesforceConnection:
         sf = Salesforce(instance=instance, session_id=session_id)
         return session_id, instance, sf
     
-    def extract_data(self, query:str) -> pd.DataFrame:
+    def extract_data(self, query:str, columns:list=None) -> pd.DataFrame:
         """
         Esta función se utiliza para hacer un query sobre el objeto Salesforce.
+
+        :param columns: las columnas que se quieren en el resultado. Si se dan, el DataFrame
+            se construye solo con ellas en lugar de construirlo completo y luego quitar 'attributes'
         Returns: Dataframe with extracted data.
         """
         sf = self.__sf
 
         response = sf.query_all(query=query)
-        df = pd.DataFrame(response.get("records")).drop(['attributes'], axis=1)
+        records = response.get("records")
+        if columns is None:
+            # Se arma por columnas, saltando 'attributes', en lugar de construirlo completo y luego hacer drop
+            columns = [key for key in records[0].keys() if key != 'attributes'] if records else []
+        df = pd.DataFrame({column: [record.get(column) for record in records] for column in columns}, columns=columns)
         return df
+
+    def query_records(self, query:str) -> list:
+        """
+        Ejecuta el query y regresa los registros tal como los manda Salesforce (lista de dicts),
+        sin armar un DataFrame. Solo trae la primera página, así que es para queries chicos o con LIMIT.
+        """
+        return self.__sf.query(query).get("records")
+
+    def extract_data_bulk(self, query:str, object_type:str, max_records:int=50000) -> pd.DataFrame:
+        """
+        Igual que extract_data, pero usa la Bulk API 2.0 de Salesforce.
+        Es mucho más rápida para extracciones grandes (decenas de miles de registros), pues
+        los resultados llegan como csv en pocas partes en lugar de páginas de 2,000 registros.
+        Para queries chicos conviene más extract_data.
+
+        Cada página de resultados se parsea en memoria en cuanto llega, sin pasar por disco ni
+        por diccionarios de Python. Todas las columnas llegan como texto (las celdas vacías como NaN).
+
+        :param query: el query a ejecutar
+        :param object_type: el objeto principal del query. Eg. Account, Contact, Product2
+        :param max_records: registros por página de resultados
+        Returns: Dataframe with extracted data.
+        """
+        sf = self.__sf
+
+        pages = getattr(sf.bulk2, object_type).query(query, max_records=max_records)
+        dfs = [_read_bulk_page(page) for page in pages if page.strip()]
+        dfs = [df for df in dfs if not df.empty]
+        if not dfs: return pd.DataFrame()
+        return pd.concat(dfs, ignore_index=True)
     
-    def add_record(self, object_type:str, data:dict, handle_exception:bool=False) -> collections.OrderedDict:
+    def add_record(self, object_type:str, data:dict, handle_exception:bool=False) -> dict:
         """
         Esta función se usa para agregar registros a un objeto.
         Es importante entender que en SalesForce los registros son objetos, eg. un MP es un objeto de tipo Account.
@@ -59,19 +146,17 @@ class SalesforceConnection:
         :param handle_excpetion: si se quiere cuidar que no haya problemas en la ejecución. Eventualmente este será el funcionamiento por defecto
         """
         if not handle_exception:
-            sf_object = SFType(object_type, self.__session_id, self.__instance)
-            response = sf_object.create(data)
+            response = self.__sftype(object_type).create(data)
             return response
         else:
             try:
-                sf_object = SFType(object_type, self.__session_id, self.__instance)
-                response = sf_object.create(data)
+                response = self.__sftype(object_type).create(data)
             except SalesforceMalformedRequest as error:
-                response = collections.OrderedDict({
+                response = {
                     'errors':[error.content[0]['message']],
                     'id':None,
                     'success':False
-                })
+                }
             return response
 
         
@@ -81,45 +166,181 @@ class SalesforceConnection:
         Esta función elimina un objeto del tipo especificado.
         Tener cuidado con el uso de esta función, que no sé que tan fácil sea recuperar registros borrados.
         """
-        sf_object = SFType(object_type, self.__session_id, self.__instance)
-        response = sf_object.delete(record_id=record_id)
+        response = self.__sftype(object_type).delete(record_id=record_id)
         return response
     
     def update_record(self, object_type:str, record_id:str, data:dict):
         """
         Esta función actualiza un objeto dado su id y los datos necesarios.
+        Usa el SFType guardado del objeto, que comparte la sesión de la conexión; si Salesforce rechaza
+        el cambio levanta la excepción correspondiente (SalesforceMalformedRequest, SalesforceResourceNotFound, ...)
+
+        :return: el status code de la respuesta (204 si el cambio se aplicó)
         """
-        sf_object = SFType(object_type, self.__session_id, self.__instance)
-        response = sf_object.update(record_id=record_id, data=data)
+        response = self.__sftype(object_type).update(record_id=record_id, data=data)
         return response
     
-    def get_available_fields(self, object_type:str, get_all_columns:bool=False) -> pd.DataFrame:
+    def add_records(self, object_type:str, records:list, batch_size:int=200) -> list:
+        """
+        Crea varios registros del mismo tipo usando composite/sobjects, hasta 200 por llamada
+        en lugar de una llamada por registro.
+
+        :param records: lista de diccionarios, uno por registro
+        :return: lista con un resultado por registro ({'id', 'success', 'errors'}), en el mismo orden
+        """
+        return self.__sobjects_collection('POST', object_type, records, batch_size)
+
+    def update_records(self, object_type:str, records:list, batch_size:int=200) -> list:
+        """
+        Actualiza varios registros del mismo tipo usando composite/sobjects, hasta 200 por llamada.
+
+        Los campos con NaN (celdas vacías del DataFrame) se quitan del registro, así que no se modifican,
+        igual que en bulk_ingest. Un None explícito se manda como null y borra el valor del campo.
+
+        :param records: lista de diccionarios, cada uno con el 'Id' del registro y los campos a cambiar
+        :return: lista con un resultado por registro ({'id', 'success', 'errors'}), en el mismo orden
+        """
+        records = [{key: value for key, value in record.items() if not _is_nan(value)} for record in records]
+        return self.__sobjects_collection('PATCH', object_type, records, batch_size)
+
+    def __sobjects_collection(self, method:str, object_type:str, records:list, batch_size:int=200) -> list:
+        '''
+        Manda los registros en lotes a composite/sobjects con allOrNone=False, de modo que un
+        registro con error no tumba al resto del lote. Si falla la llamada completa, todos los
+        registros del lote se regresan como error.
+        '''
+        batch_size = min(batch_size, 200) # Límite de Salesforce para composite/sobjects
+        results = []
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            payload = {
+                'allOrNone': False,
+                'records': [{'attributes': {'type': object_type}, **record} for record in batch]
+            }
+            try:
+                body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+                results.extend(self.__sf.restful('composite/sobjects', method=method, data=body, headers={'Content-Type': 'application/json'}))
+            except (SalesforceMalformedRequest, SalesforceResourceNotFound) as error:
+                results.extend({'id': None, 'success': False, 'errors': error.content} for _ in batch)
+        return results
+    
+    def bulk_ingest(self, object_type:str, df:pd.DataFrame, operation:str='insert') -> pd.DataFrame:
+        """
+        Manda todo el dataframe a la Bulk API 2.0 como un solo csv. Salesforce procesa el job
+        del lado del servidor, así que para decenas de miles de registros son unas cuantas
+        llamadas en lugar de cientos de lotes de composite/sobjects.
+
+        :param object_type: tipo de objeto. Eg. Account, Contact, Product2
+        :param df: un registro por fila; las columnas deben llamarse como los campos en Salesforce.
+            Para 'update' debe incluir la columna Id
+        :param operation: 'insert' o 'update'
+        :return: dataframe con los registros que fallaron (sf__Id, sf__Error y las columnas originales)
+        """
+        bulk_object = getattr(self.__sf.bulk2, object_type)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, 'records.csv')
+            df.to_csv(csv_path, index=False)
+            results = getattr(bulk_object, operation)(csv_file=csv_path)
+
+        failed = [
+            pd.read_csv(io.StringIO(bulk_object.get_failed_records(result['job_id'])), dtype=str)
+            for result in results if result['numberRecordsFailed'] > 0
+        ]
+        if not failed: return pd.DataFrame(columns=['sf__Id', 'sf__Error', *df.columns])
+        return pd.concat(failed, ignore_index=True)
+    
+    def get_available_fields(self, object_type:str, get_all_columns:bool=False, ttl:float=300) -> pd.DataFrame:
         '''
         Esta función permite extraer los fields disponibles de consulta para el objeto especificado
+
+        :param ttl: segundos que se reusa el describe() guardado del objeto
         '''
-        sf_object = SFType(object_type, self.__session_id, self.__instance)
-        object_metadata = sf_object.describe().get('fields') # Si cambiamos fields por otra cosa podemos traer en realidad cualquier metadata
-        df = pd.DataFrame(object_metadata)
+        object_metadata = self.__describe(object_type, ttl).get('fields') # Si cambiamos fields por otra cosa podemos traer en realidad cualquier metadata
 
-        if get_all_columns: return df
-        return df[['name']].rename({'name':'available_fields'}, axis=1)
+        if get_all_columns: return pd.json_normalize(object_metadata, max_level=0)
+        return pd.DataFrame({'available_fields': [field['name'] for field in object_metadata]})
     
-    def get_picklist_values(self, object_type:str, field_name:str) -> pd.DataFrame:
+    def get_picklist_values(self, object_type:str, field_name:str, ttl:float=300) -> pd.DataFrame:
         '''
         Esta función sirve para sacar los available picklist values de un field.
 
         :param object_type: el tipo de objeto que se buscará
         :param field_name: el field dentro del objeto que se desea
+        :param ttl: segundos que se reusa el describe() guardado del objeto
 
         :return: pd.DataFrame con los picklist values, None si no es picklist values
         '''
-        all_metadata = self.get_available_fields(object_type, get_all_columns=True)
-        try:
-            pick_values = all_metadata.query(f'name == "{field_name}"').picklistValues.values[0]
-            list_values = [value.get('label') for value in pick_values]
-            return pd.DataFrame(list_values, columns=['picklist_values'])
-        except IndexError:
-            return None
+        for field in self.__describe(object_type, ttl).get('fields'):
+            if field['name'] == field_name:
+                list_values = [value.get('label') for value in field.get('picklistValues', [])]
+                return pd.DataFrame(list_values, columns=['picklist_values'])
+        return None
+
+    def find_invalid_rows(self, object_type:str, df:pd.DataFrame, creating:bool=True) -> pd.Series:
+        '''
+        Revisa localmente, con el describe() guardado, qué filas rechazaría Salesforce de seguro:
+        campos obligatorios vacíos o que no vienen (solo al crear) y valores que no existen
+        en un picklist restringido. Así no se gasta una llamada a la API en cada una de ellas.
+
+        :param df: un registro por fila; las columnas son los nombres de los campos en Salesforce
+        :param creating: True si los registros se van a crear, False si se van a actualizar
+        :return: serie booleana con el mismo índice que df; True para las filas inválidas
+        '''
+        fields = {field['name'].lower(): field for field in self.__describe(object_type).get('fields')}
+        columns = {column.lower(): column for column in df.columns}
+
+        if creating:
+            required = [name for name, field in fields.items() if field['createable'] and not field['nillable'] and not field['defaultedOnCreate']]
+            if any(name not in columns for name in required): return pd.Series(True, index=df.index)
+
+        invalid = pd.Series(False, index=df.index)
+        for name, column in columns.items():
+            field = fields.get(name)
+            if field is None: continue
+            values = df[column]
+            # Al actualizar una celda vacía no se manda (el campo no cambia), así que solo cuenta al crear
+            if creating and not field['nillable'] and field['createable']:
+                invalid |= values.isna()
+            if field['type'] == 'picklist' and field.get('restrictedPicklist'):
+                valid_values = {value['value'] for value in field.get('picklistValues', []) if value.get('active')}
+                invalid |= values.notna() & ~values.isin(valid_values)
+        return invalid
+
+    def invalidate_describe(self, object_type:str=None) -> None:
+        '''
+        Borra el describe() guardado para que se vuelva a pedir a Salesforce.
+        Útil cuando se sabe que cambiaron los campos o los picklist values del objeto.
+
+        :param object_type: el objeto a borrar; si es None se borran todos
+        '''
+        if object_type is None:
+            self.__describe_cache.clear()
+        else:
+            self.__describe_cache.pop(object_type, None)
+
+    def __sftype(self, object_type:str) -> SFType:
+        '''
+        Regresa el SFType del objeto, creándolo solo la primera vez. Usa la misma sesión
+        de requests que la conexión, así que también se reusan las conexiones abiertas.
+        '''
+        sf_object = self.__sftypes.get(object_type)
+        if sf_object is None:
+            sf_object = self.__sftypes[object_type] = SFType(object_type, self.__session_id, self.__instance, session=self.__sf.session)
+        return sf_object
+
+    def __describe(self, object_type:str, ttl:float=300) -> dict:
+        '''
+        Regresa el describe() del objeto. Se guarda por ttl segundos, pues es una llamada
+        completa a la API y la metadata casi nunca cambia.
+        '''
+        cached = self.__describe_cache.get(object_type)
+        if cached is not None and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+
+        description = self.__sftype(object_type).describe()
+        self.__describe_cache[object_type] = (time.monotonic(), description)
+        return description
         
 class SalesforceFunctions:
     '''
@@ -127,61 +348,52 @@ class SalesforceFunctions:
     '''
     def __init__(self, sfc:SalesforceConnection) -> None:
         self.sfc = sfc
+        # Los record type ids no cambian dentro de una org: {(sobject, record_type_name): id}
+        self.__record_type_ids = {}
 
-    def change_values(self, df:pd.DataFrame, sf_field:str, verbose:bool=False, print_every:int=1, object_type:str='Account') -> list:
+    def change_values(self, df:pd.DataFrame, sf_field:str, verbose:bool=False, print_every:int=1, object_type:str='Account', max_workers:int=8) -> list:
         '''
         Esta función recibe un dataframe con índices (salesforce ids) y un solo valor
         sf_field es el nombre del field en salesforce que se quiere cambiar
 
+        :param max_workers: lotes de 200 que se mandan en paralelo; no debe pasar del límite de llamadas concurrentes de la org
+
         Regresa una lista con los valores que no se haya podido actualizar
         '''
-        sfc = self.sfc
-
-        i = 1
-        errors = []
-        for row in df.itertuples():
-            sf_id, value = row
-            try:
-                sfc.update_record(object_type, sf_id, {sf_field:value})
-            except SalesforceMalformedRequest as e:
-                if verbose: 
-                    print(f'Request is malformed {sf_id}')
-                errors.append(row)
-            except SalesforceResourceNotFound:
-                if verbose: print(f'Id not found: {sf_id}')
-                errors.append(row)
-            if verbose and i % print_every == 0: print(f'{i}/{df.size}')
-            i += 1
-        return errors
+        rows = list(df.itertuples())
+        records = [{'Id':sf_id, sf_field:value} for sf_id, value in rows]
+        return self.__send_in_batches(self.sfc.update_records, object_type, records, rows, verbose, print_every, max_workers)
 
-    def change_multiple_values(self, df:pd.DataFrame, verbose:bool=False, print_every:int=1, object_type:str='Account') -> list:
+    def change_multiple_values(self, df:pd.DataFrame, verbose:bool=False, print_every:int=1, object_type:str='Account', bulk_threshold:int=2000, max_workers:int=8, validate:bool=False) -> list:
         '''
         Esta función recibe un dataframe con índices (salesforce ids) y columnas correspondientes a los campos a cambiar
         
         :param df: dataframe con formato especificado
+        :param bulk_threshold: a partir de este número de filas se usa la Bulk API 2.0. Las celdas con NaN no se modifican; un None explícito borra el campo (solo por composite, no en Bulk)
+        :param max_workers: lotes de 200 que se mandan en paralelo; no debe pasar del límite de llamadas concurrentes de la org
+        :param validate: si se revisan localmente las filas antes de mandarlas (ver SalesforceConnection.find_invalid_rows)
 
         :return: lista con errores
         '''
-        sfc = self.sfc
-        dictionary = df.transpose().to_dict()
-        i = 1
         errors = []
-        for sf_id, data_dict in dictionary.items():
-            try:
-                sfc.update_record(object_type, sf_id, data_dict)
-            except SalesforceMalformedRequest as e:
-                if verbose: 
-                    print(f'Malformed Request for {sf_id}')
-                    print(e)
-                errors.append(sf_id)
-            except SalesforceResourceNotFound:
-                if verbose: print(f'Id not found: {sf_id}')
-                errors.append(sf_id)
-            if verbose and i % print_every == 0: print(f'{i}/{df.shape[0]}')
-            i += 1
-        return errors
-
-    def add_related_records(self, df:pd.DataFrame, add_type:str, related_index_name:str, constant_values:dict=None, verbose:bool=True, print_every:int=1) -> list:
+        if validate:
+            invalid = self.sfc.find_invalid_rows(object_type, df, creating=False)
+            if invalid.any():
+                if verbose: print(f'{invalid.sum()} registros no pasaron la validación local')
+                errors = df.index[invalid.to_numpy()].tolist()
+                df = df[~invalid.to_numpy()]
+
+        if len(df) > bulk_threshold:
+            failed = self.sfc.bulk_ingest(object_type, df.rename_axis('Id').reset_index(), 'update')
+            if verbose: print(failed[['Id', 'sf__Error']])
+            return errors + failed['Id'].tolist()
+
+        columns = ('Id', *df.columns)
+        rows = df.index.tolist()
+        records = [dict(zip(columns, row)) for row in df.itertuples(index=True, name=None)]
+        return errors + self.__send_in_batches(self.sfc.update_records, object_type, records, rows, verbose, print_every, max_workers)
+
+    def add_related_records(self, df:pd.DataFrame, add_type:str, related_index_name:str, constant_values:dict=None, verbose:bool=True, print_every:int=1, max_workers:int=8) -> list:
         '''
         Esta función sirve para crear nuevos registros de objetos que estén relacionados con otro objeto.
         IMPORTANTE: NO VERIFICA QUE EXISTAN DUPLICADOS
@@ -192,67 +404,80 @@ class SalesforceFunctions:
         :param add_type: el tipo de objeto a crear
         :param related_index_name: el nombre del id identificador del objeto relacioando. Eg. AccountId, Account__c, account__c
         :param constant_values: variables que sean iguales para todos los nuevos objetos. Eg. {'type_address__c':'Warehouse'}
+        :param max_workers: lotes de 200 que se mandan en paralelo; no debe pasar del límite de llamadas concurrentes de la org
         
         :return: lista con los errores encontrados
 
         Eg. add_related_records(sfc, df, add_type='address__c', related_index_name='Account__c', constant_values={'type_address__c':'Warehouse'})
         '''
-        sfc = self.sfc
-        if print_every <= 0: print_every = 1
-        columns = df.columns
-        i = 1
-        errors = []
+        columns = tuple(df.columns)
+        constant_values = constant_values or {}
+        rows = []
+        records = []
         for row in df.itertuples():
             
             # Creamos el diccionario para crear el nuevo objeto
-            sf_index = row[0]
-            data_dict = {related_index_name:sf_index}
-            if constant_values is not None: data_dict.update(constant_values)
-            
-            for index, column in enumerate(columns, start=1):
-                data_dict[column] = row[index]
-        
-            try:
-                sfc.add_record(add_type, data_dict)
-            except SalesforceMalformedRequest as e:
-                if verbose: print(e)
-                errors.append(row)
-            except SalesforceResourceNotFound:
-                if verbose: print(f'Could not find {index}')
-                errors.append(row)
-            if verbose and i % print_every == 0: print(f'{i}/{df.shape[0]}')
-            i += 1
-        return errors
+            data_dict = {related_index_name:row[0]}
+            data_dict.update(constant_values)
+            data_dict.update(zip(columns, row[1:]))
 
-    def add_multiple_records(self, df:pd.DataFrame, add_type:str, verbose:bool=False, print_every:int=1) -> list:
+            rows.append(row)
+            records.append(data_dict)
+        return self.__send_in_batches(self.sfc.add_records, add_type, records, rows, verbose, print_every, max_workers)
+
+    def add_multiple_records(self, df:pd.DataFrame, add_type:str, verbose:bool=False, print_every:int=1, bulk_threshold:int=2000, max_workers:int=8, validate:bool=False) -> list:
         '''
         Esta función sirve para dar de alta múltiples registros a la vez desde un dataframe de pandas.
 
         :param df: dataframe con un registro por fila; los nombres de las columnas deben coincidir con los nombres de la api de salesforce
         :param add_type: el tipo de objeto del cual se crearán nuevos registros
+        :param bulk_threshold: a partir de este número de filas se usa la Bulk API 2.0
+        :param max_workers: lotes de 200 que se mandan en paralelo; no debe pasar del límite de llamadas concurrentes de la org
+        :param validate: si se revisan localmente las filas antes de mandarlas (ver SalesforceConnection.find_invalid_rows)
 
         :return: lista con errores
         '''
-        sfc = self.sfc
+        errors = []
+        if validate:
+            invalid = self.sfc.find_invalid_rows(add_type, df, creating=True)
+            if invalid.any():
+                if verbose: print(f'{invalid.sum()} registros no pasaron la validación local')
+                errors = df[invalid.to_numpy()].to_dict('records')
+                df = df[~invalid.to_numpy()]
+
+        if len(df) > bulk_threshold:
+            failed = self.sfc.bulk_ingest(add_type, df, 'insert')
+            if verbose: print(failed['sf__Error'])
+            return errors + failed.drop(columns=['sf__Id', 'sf__Error']).to_dict('records')
+
+        columns = tuple(df.columns)
+        records = [dict(zip(columns, row)) for row in df.itertuples(index=False, name=None)]
+        return errors + self.__send_in_batches(self.sfc.add_records, add_type, records, records, verbose, print_every, max_workers)
+
+    def __send_in_batches(self, send, object_type:str, records:list, rows:list, verbose:bool, print_every:int, max_workers:int=8) -> list:
+        '''
+        Manda los registros en lotes de 200 (una llamada a composite/sobjects por lote) y
+        regresa los elementos de rows cuyo registro no se pudo guardar.
+        Los lotes se mandan en paralelo con hasta max_workers hilos, pero los resultados se
+        revisan en orden, así que los errores salen en el mismo orden que las filas.
+
+        :param send: sfc.add_records o sfc.update_records
+        :param records: diccionarios a mandar a Salesforce
+        :param rows: lo que se agrega a la lista de errores por cada registro; mismo orden que records
+        '''
         if print_every <= 0: print_every = 1
-            
-        i = 1
+        total = len(records)
+        starts = range(0, total, 200)
         errors = []
-        aux_dict = df.transpose().to_dict()
-        
-        for _, data_dict in aux_dict.items():
-            try:
-                sfc.add_record(add_type, data_dict)
-            except SalesforceMalformedRequest as e:
-                if verbose: 
-                    print(f'Malformed Request for {data_dict}')
-                    print(e)
-                errors.append(data_dict)
-            except SalesforceResourceNotFound:
-                if verbose: print(f'Id not found: {data_dict}')
-                errors.append(data_dict)
-            if verbose and i % print_every == 0: print(f'{i}/{df.shape[0]}')
-            i += 1
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = [executor.submit(send, object_type, records[start:start + 200]) for start in starts]
+            for start, future in zip(starts, futures):
+                end = min(start + 200, total)
+                for row, result in zip(rows[start:end], future.result()):
+                    if result.get('success'): continue
+                    if verbose: print(f'Error for {row}: {result.get("errors")}')
+                    errors.append(row)
+                if verbose and (end // print_every > start // print_every or end == total): print(f'{end}/{total}')
         return errors
 
     def get_record_type_id(self, sobject:str, record_type_name:str):
@@ -265,17 +490,19 @@ class SalesforceFunctions:
 
         :return: el id o None, dependiendo si se encuntra o no
         '''
-        sfc = self.sfc
-        try:
-            query = f'''
-            select Id
-            from RecordType
-            where SobjectType = '{sobject}' and Name = '{record_type_name}'
-            '''
-            rt_id = sfc.extract_data(query).Id[0]
-            return rt_id
-        except IndexError:
-            return None
+        key = (sobject, record_type_name)
+        if key in self.__record_type_ids: return self.__record_type_ids[key]
+
+        query = f'''
+        select Id
+        from RecordType
+        where SobjectType = '{_esc(sobject)}' and Name = '{_esc(record_type_name)}'
+        limit 1
+        '''
+        records = self.sfc.query_records(query)
+        if not records: return None
+        rt_id = self.__record_type_ids[key] = records[0]['Id']
+        return rt_id
         
     def __build_query(self, specs:dict) -> str:
         '''
@@ -308,7 +535,7 @@ class SalesforceFunctions:
             for condition in specs['filters']:
                 kind = condition.get('kind')
                 if kind == 'str':
-                    str_con = f"{condition['field']} = '{condition['condition']}'"
+                    str_con = f"{condition['field']} = '{_esc(condition['condition'])}'"
                 elif kind == 'num':
                     str_con = f"{condition['field']} {condition['condition']}"
                 conds.append(str_con)
@@ -336,23 +563,16 @@ class SalesforceFunctions:
         query = self.__build_query(specs)
 
         # Ejecutamos el query y lo acomodamos como debe de ser con base en los inputs de specs
-        id_name = re.sub('(__s$|__c$)', '', specs['sobject']).replace('__', '_') + '_id'
+        id_name = _SF_SUFFIX_RE.sub('', specs['sobject']).replace('__', '_') + '_id'
         
+        data = sfc.extract_data(query)
         if source_id_name is None:
-            data = (
-                sfc
-                .extract_data(query)
-                .rename({'Id':id_name}, axis=1)
-                .rename(lambda x: re.sub('(__s$|__c$)', '', x.lower()).replace('__', '_'), axis=1)
-            )
+            data = data.rename({'Id':id_name}, axis=1)
+            data.columns = [_normalize_sf_name(column) for column in data.columns]
             output = (id_name.lower(), data)
         else:
-            data = (
-                sfc
-                .extract_data(query)
-                .rename({'Id':id_name, specs['relation_field']:source_id_name}, axis=1)
-                .rename(lambda x: re.sub('(__s$|__c$)', '', x.lower()).replace('__', '_'), axis=1)
-            )
+            data = data.rename({'Id':id_name, specs['relation_field']:source_id_name}, axis=1)
+            data.columns = [_normalize_sf_name(column) for column in data.columns]
             output = data
         return output
     
@@ -394,7 +614,10 @@ class SalesforceFunctions:
 
         if how_join is None: return source_data, dfs
         
-        # Y ahora juntamos todos los dfs en uno solo
+        # Y ahora juntamos todos los dfs en uno solo. La llave se pone como índice una sola vez
+        # para que cada join reuse el índice en lugar de volver a hashear la columna en cada merge.
+        # Las columnas repetidas llevan los mismos sufijos que ponía merge (_x, _y)
+        source_data = source_data.set_index(source_id_name)
         for df in dfs:
-            source_data = source_data.merge(df, on=source_id_name, how=how_join)
-        return source_data
\ No newline at end of file
+            source_data = source_data.join(df.set_index(source_id_name), how=how_join, lsuffix='_x', rsuffix='_y')
+        return source_data.reset_index()
\ No newline at end of file
@@ -1,12 +1,31 @@
 import os
+import time
+import hashlib
+import random
+import tempfile
+import threading
+import orjson
 import gspread
 import numpy as np
 import pandas as pd
-from google.auth.transport.requests import Request
+import pyarrow as pa
+from urllib3.util.retry import Retry
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from google.auth.exceptions import RefreshError, TransportError
+from google.auth.transport.requests import Request, AuthorizedSession
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 
 class SheetsFunctions:
+    # Las escrituras grandes se parten en pedazos de a lo más estas celdas, para no pasar el límite
+    # de tamaño de la API, y entre pedazos se espera para respetar la cuota de escrituras por minuto
+    _MAX_CELLS_PER_REQUEST = 40000
+    _SECONDS_BETWEEN_WRITES = 1
+    # Credenciales ya cargadas, compartidas entre instancias, con la única renovación programada para cada token:
+    # {path del token: (mtime del archivo, credentials, timer de la renovación o None)}
+    _TOKEN_CACHE = {}
+    _TOKEN_LOCK = threading.Lock()
+
     def __init__(self, spreadsheet_id:str, credentials:str, token:str, sheet_name:str=None) -> None:
         '''
         :param spreadsheet_id: el ide del spreadsheet que se desea trabajar
@@ -18,7 +37,17 @@ class SheetsFunctions:
         self.__SHEET_NAME = sheet_name # Este se puede poner después con base en las que haya disponibles
 
         self.__credentials = self.__load_credentials(credentials, token)
-        self.__gc = gspread.authorize(self.__credentials)
+        SheetsFunctions.__schedule_refresh(os.path.abspath(token))
+
+        # Una sola sesión con pool de conexiones para que todas las llamadas reusen la conexión abierta.
+        # Urllib3 no reintenta POST por defecto, así que append_rows no se duplica
+        session = AuthorizedSession(self.__credentials)
+        session.mount('https://', HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=10,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        ))
+        self.__gc = gspread.Client(auth=self.__credentials, session=session)
 
         try:
             self.__wb = self.__gc.open_by_url(self.__SPREADSHEET_ID)
@@ -26,6 +55,13 @@ class SheetsFunctions:
             self.__wb = self.__gc.open_by_key(self.__SPREADSHEET_ID)            
 
         self.__ws = None
+        self.__header = None # Se llena la primera vez que se necesita con la fila 1 de la hoja
+        self.__values_cache = None # (momento en que se leyó, valores de todas las celdas de la hoja)
+        self.__last_write_hash = None # sha1 de lo último que escribió write_dataframe, si no ha habido otra escritura
+        self.__buffer = None # Copia local de los registros mientras se usa la instancia como context manager
+        self.__dirty = {} # Celdas cambiadas en el buffer que faltan por escribir: {(fila, columna): valor}
+        self.__buffer_values = None # Lectura de la hoja de la que sale el buffer, para revisar antes de escribir
+        self.__pending = [] # Llamadas (id, values) aplicadas al buffer, para repetirlas si la hoja cambió
         if self.__SHEET_NAME is not None:
             self.__ws = self.__wb.worksheet(self.__SHEET_NAME)
         
@@ -45,38 +81,107 @@ class SheetsFunctions:
         :return: 
         '''
         if self.__ws is None:
-            raise 'No work sheet has been specified'
+            raise RuntimeError('No work sheet has been specified')
         return self.__ws
         
-    def get_current_data(self) -> pd.DataFrame:
+    def get_current_data(self, ttl:float=30, dtype_backend:str=None) -> pd.DataFrame:
         '''
         Esta función extrae la información contenida actualmente en el sheets.
 
+        :param ttl: segundos que se reusa la última lectura de la hoja. Cualquier escritura desde esta clase la invalida
+        :param dtype_backend: 'pyarrow' para regresar columnas con tipos de arrow (enteros, decimales, texto)
+            en lugar de columnas object; las columnas con tipos mezclados se quedan como están
         :return: pd.DataFrame con el contenido, sustitye '' por None
         '''
         try:
-            current_data = (
-                pd
-                .DataFrame(self.__ws.get_all_records())
-                .replace({'':None})
-            )
+            current_data = self.__get_records(ttl)
+            current_data = current_data.mask(current_data == '', None)
+            if dtype_backend == 'pyarrow': current_data = self.__to_arrow(current_data)
         except gspread.exceptions.GSpreadException:
             # Esta exepción ocurre cuando los nombres de las columnas
-            # son iguales, lo que evita que funcione get_all_records()
+            # son iguales, lo que evita que se puedan armar los registros
             # print('Unable to read columns due to duplicity of names')
 
             current_data = (
                 pd
-                .DataFrame(self.__ws.get_values())
+                .DataFrame(self.__get_values(ttl))
                 .replace({'':None})
                 .dropna(how='all', axis=1)
                 .dropna(how='all', axis=0)
             )
         return current_data
     
+    @staticmethod
+    def __to_arrow(df:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Convierte cada columna a un arreglo de arrow, que infiere el tipo en C y guarda los datos
+        de forma contigua. Si una columna mezcla tipos (eg. números y texto) se deja como está.
+        '''
+        for name, column in df.items():
+            try:
+                arrow_column = pa.array(column.tolist(), from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                continue
+            df[name] = pd.Series(pd.arrays.ArrowExtensionArray(arrow_column), index=df.index)
+        return df
+
     def set_sheetname(self, sheet_name:str) -> None:
         self.__SHEET_NAME = sheet_name
         self.__ws = self.__wb.worksheet(self.__SHEET_NAME)
+        self.__header = None
+        self.__values_cache = None
+        self.__last_write_hash = None
+
+    def __get_values(self, ttl:float=30) -> list:
+        '''
+        Regresa todas las celdas de la hoja como lista de listas (la primera es el header).
+        Los números llegan como números y las fechas como texto formateado.
+        La lectura se guarda por ttl segundos para que varias operaciones seguidas no vuelvan a
+        pedir toda la hoja. No se debe modificar la lista que regresa.
+        '''
+        cached = self.__values_cache
+        if cached is None or time.monotonic() - cached[0] >= ttl:
+            values = self.__ws.get_values(value_render_option='UNFORMATTED_VALUE', date_time_render_option='FORMATTED_STRING')
+            cached = self.__values_cache = (time.monotonic(), values)
+            # La misma lectura trae el header, así que no hace falta pedirlo aparte con row_values
+            self.__header = list(values[0]) if values else []
+        return cached[1]
+
+    def __get_records(self, ttl:float=30) -> pd.DataFrame:
+        '''
+        Regresa los registros de la hoja como dataframe, usando la fila 1 como nombres de columnas.
+        Se arma directo de los valores, sin pasar por un diccionario por fila como get_all_records.
+
+        Levanta GSpreadException si hay nombres de columnas repetidos.
+        '''
+        values = self.__get_values(ttl)
+        header = values[0] if values else []
+        if len(set(header)) != len(header):
+            raise gspread.exceptions.GSpreadException('the header row in the worksheet is not unique')
+        return pd.DataFrame(values[1:], columns=header)
+
+    def __get_header(self) -> list:
+        '''
+        Regresa los nombres de las columnas (fila 1) de la hoja. Se pide una sola vez y se guarda
+        hasta que se reescribe la hoja o se cambia de hoja. Si ya se leyó la hoja completa se toma de ahí.
+        '''
+        if self.__header is None:
+            self.__header = self.__ws.row_values(1)
+        return self.__header
+
+    def __append_rows(self, df:pd.DataFrame) -> None:
+        '''
+        Agrega las filas del dataframe al final de la hoja, en el orden de columnas del header.
+        Solo manda las filas nuevas, sin leer ni reescribir las que ya están.
+        '''
+        header = self.__get_header()
+        values = self.__to_values(df.reindex(columns=header))
+        chunk_rows = self.__chunk_rows(len(header))
+        for start in range(0, len(values), chunk_rows):
+            if start: time.sleep(self._SECONDS_BETWEEN_WRITES)
+            self.__ws.append_rows(values[start:start + chunk_rows], value_input_option='RAW', insert_data_option='INSERT_ROWS')
+        self.__values_cache = None
+        self.__last_write_hash = None
     
     def __load_credentials(self, credentials_path:str, token_path:str) -> Credentials:
         '''
@@ -90,30 +195,167 @@ class SheetsFunctions:
         credentials = None
 
         if os.path.exists(token_path):
-            credentials = Credentials.from_authorized_user_file(token_path, self.__SCOPES)
+            # Si el archivo no ha cambiado desde la última vez que se leyó, se reusan las credenciales
+            key = os.path.abspath(token_path)
+            mtime = os.path.getmtime(token_path)
+            cached = SheetsFunctions._TOKEN_CACHE.get(key)
+            if cached is not None and cached[0] == mtime:
+                credentials = cached[1]
+            else:
+                credentials = Credentials.from_authorized_user_file(token_path, self.__SCOPES)
+                SheetsFunctions.__cache_credentials(key, mtime, credentials)
         if not credentials or not credentials.valid:
             if credentials and credentials.expired and credentials.refresh_token:
                 credentials.refresh(Request())
             else:
+                # Solo se necesita cuando no hay token que sirva; se importa aquí para no cargarlo en cada inicio
+                from google_auth_oauthlib.flow import InstalledAppFlow
                 flow = InstalledAppFlow.from_client_secrets_file(credentials_path, self.__SCOPES)
                 credentials = flow.run_local_server(port=0)
-            with open(token_path, 'w') as token:
-                token.write(credentials.to_json())
+            self.__save_token(credentials, token_path)
 
         return credentials
+
+    @staticmethod
+    def __save_token(credentials:Credentials, token_path:str) -> None:
+        '''
+        Guarda el token en el archivo y actualiza las credenciales compartidas con el nuevo mtime.
+        Se escribe a un archivo temporal y luego se reemplaza, así si algo falla a la mitad (o
+        otro proceso lo lee mientras se escribe) no se queda un token a medias.
+        '''
+        key = os.path.abspath(token_path)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(key))
+        try:
+            with os.fdopen(fd, 'w') as token:
+                token.write(credentials.to_json())
+            os.replace(tmp_path, token_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        SheetsFunctions.__cache_credentials(key, os.path.getmtime(token_path), credentials)
+
+    @staticmethod
+    def __cache_credentials(key:str, mtime:float, credentials:Credentials) -> None:
+        '''
+        Guarda las credenciales del token en _TOKEN_CACHE. Si son las mismas que ya estaban se
+        conserva su renovación programada; si son otras, la renovación de las anteriores se cancela.
+        '''
+        with SheetsFunctions._TOKEN_LOCK:
+            cached = SheetsFunctions._TOKEN_CACHE.get(key)
+            timer = None
+            if cached is not None and cached[2] is not None:
+                if cached[1] is credentials: timer = cached[2]
+                else: cached[2].cancel()
+            SheetsFunctions._TOKEN_CACHE[key] = (mtime, credentials, timer)
+
+    @staticmethod
+    def __schedule_refresh(key:str) -> None:
+        '''
+        Programa la renovación del token un minuto antes de que expire, en un hilo aparte, para que
+        ninguna llamada a la API se quede esperando a que se renueve.
+        Las credenciales se comparten entre instancias, así que hay un solo timer por token, guardado
+        en _TOKEN_CACHE; si ya hay uno programado no se programa otro.
+        '''
+        with SheetsFunctions._TOKEN_LOCK:
+            cached = SheetsFunctions._TOKEN_CACHE.get(key)
+            if cached is None or cached[2] is not None: return
+            mtime, credentials, _ = cached
+            if credentials.expiry is None or not credentials.refresh_token: return
+
+            # expiry viene en UTC sin zona horaria
+            delay = (credentials.expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds() - 60
+            timer = threading.Timer(max(0, delay), SheetsFunctions.__refresh_in_background, args=(key, credentials))
+            timer.daemon = True
+            SheetsFunctions._TOKEN_CACHE[key] = (mtime, credentials, timer)
+        timer.start()
+
+    @staticmethod
+    def __refresh_in_background(key:str, credentials:Credentials) -> None:
+        '''
+        Renueva el token, lo guarda en el archivo y programa la siguiente renovación.
+        Si las credenciales ya no son las del cache (el archivo cambió) no hace nada.
+        Si falla, la sesión lo vuelve a intentar sola en la siguiente llamada a la API.
+        '''
+        with SheetsFunctions._TOKEN_LOCK:
+            cached = SheetsFunctions._TOKEN_CACHE.get(key)
+            if cached is None or cached[1] is not credentials: return
+            SheetsFunctions._TOKEN_CACHE[key] = (cached[0], credentials, None)
+        try:
+            credentials.refresh(Request())
+            SheetsFunctions.__save_token(credentials, key)
+        except (RefreshError, TransportError, OSError):
+            return
+        SheetsFunctions.__schedule_refresh(key)
     
+    @staticmethod
+    def __to_values(df:pd.DataFrame) -> list:
+        '''
+        Convierte el dataframe en la lista de filas que se manda a la API, con None en lugar de NaN
+        (NaN no es un valor válido en json). Cada columna se convierte con su propio tolist(), que
+        regresa ints/floats nativos sin pasar por un arreglo object de todo el dataframe.
+        Las fechas se mandan como texto iso (NaT como celda vacía), pues json no tiene fechas.
+        '''
+        columns = [SheetsFunctions.__column_values(column) for _, column in df.items()]
+        return [list(row) for row in zip(*columns)]
+
+    @staticmethod
+    def __column_values(column:pd.Series) -> list:
+        '''Valores de una columna para __to_values'''
+        if pd.api.types.is_datetime64_any_dtype(column):
+            return ['' if pd.isna(value) else value.isoformat() for value in column]
+        if column.hasnans:
+            return column.astype(object).where(column.notna(), None).tolist()
+        return column.tolist()
+
+    @staticmethod
+    def __to_cell(value):
+        '''
+        Convierte un valor suelto igual que __to_values: None en lugar de NaN, fechas en iso y escalares
+        de numpy a su tipo nativo de python, para que se pueda mandar en el json de la API.
+        '''
+        if pd.api.types.is_scalar(value) and pd.isna(value): return None
+        if isinstance(value, (datetime, np.datetime64)): return pd.Timestamp(value).isoformat()
+        return value.item() if isinstance(value, np.generic) else value
+
     def write_dataframe(self, df:pd.DataFrame, index:bool=False) -> dict:
         '''
         Esta función escribe el contenido del dataframe al sheets
         Tener cuidado, pues si ya hay valores en las celdas estas serán sobreescritas
 
+        Si el dataframe está vacío, o es idéntico a lo último que se escribió desde esta instancia
+        sin escrituras de por medio, no se hace la llamada y se regresa {}.
+
         :param df: dataframe a escribir
         :param index: si se desea escribir el index o no
         '''
         if index:
             df.reset_index(inplace=True)
 
-        return self.__ws.update([df.columns.values.tolist()] + df.values.tolist())
+        if df.empty: return {}
+
+        # Se convierte con __to_values, igual que al agregar filas, para que los floats lleguen
+        # completos (to_json los redondea) y las fechas en el mismo formato
+        header = df.columns.values.tolist()
+        values = [header] + self.__to_values(df)
+        payload_hash = hashlib.sha1(orjson.dumps(values, option=orjson.OPT_SERIALIZE_NUMPY)).digest()
+        if payload_hash == self.__last_write_hash: return {}
+
+        self.__header = None
+        self.__values_cache = None
+        chunk_rows = self.__chunk_rows(len(header))
+        for start in range(0, len(values), chunk_rows):
+            if start: time.sleep(self._SECONDS_BETWEEN_WRITES)
+            response = self.__wb.values_update(
+                gspread.utils.absolute_range_name(self.__ws.title, f'A{start + 1}'),
+                params={'valueInputOption': 'RAW'},
+                body={'values': values[start:start + chunk_rows]}
+            )
+        self.__last_write_hash = payload_hash
+        return response
+
+    def __chunk_rows(self, n_columns:int) -> int:
+        '''Filas que caben en una sola escritura sin pasar de _MAX_CELLS_PER_REQUEST celdas'''
+        return max(1, self._MAX_CELLS_PER_REQUEST // max(1, n_columns))
     
     def add_record(self, data:dict, index:bool=False) -> None:
         '''
@@ -123,13 +365,22 @@ class SheetsFunctions:
 
         :param data: diccionario de la forma {col_name:value}
         '''
-        # Leemos el contenido actual de la hoja
+        # Si todas las columnas ya existen basta con agregar la fila al final, en el orden del header.
+        # Pasa por __to_values para mandar valores nativos (ni escalares de numpy ni NaN)
+        header = self.__get_header()
+        if header and set(data).issubset(header):
+            row = self.__to_values(pd.DataFrame([data]).reindex(columns=header))[0]
+            self.__ws.append_row(row, value_input_option='RAW', insert_data_option='INSERT_ROWS')
+            self.__values_cache = None
+            self.__last_write_hash = None
+            return
+
+        # Si no, leemos el contenido actual de la hoja y la reescribimos completa
         current_data = self.get_current_data()
 
         new_data = (
             pd
             .concat((current_data, pd.DataFrame([data])), ignore_index=True)
-            .replace({np.NaN:None})
         )
         
         self.write_dataframe(new_data, index)
@@ -140,25 +391,43 @@ class SheetsFunctions:
 
         :param data: dataframe a agregar al final de los registros actuales}
         :param index: si se agrega o no el índice del dataframe que se pasó
+        :param drop_duplicates: columnas con las que se identifican registros repetidos (nuevos o ya en la hoja);
+            se queda el último. Solo se reescribe toda la hoja si hay que quitar alguno de los registros actuales
         '''
         if index:
             data.reset_index(inplace=True)
 
+        header = self.__get_header()
+        columns_exist = bool(header) and set(data.columns).issubset(header)
+
+        # Sin duplicados que revisar y con columnas que ya existen, basta con agregar las filas al final
+        if drop_duplicates is None and columns_exist:
+            return self.__append_rows(data)
+
         current_data = self.get_current_data()
+        repeated = pd.Series(False, index=current_data.index)
+
+        if drop_duplicates is not None:
+            # Los repetidos dentro de data se resuelven ahí mismo; de los registros actuales se quitan los
+            # que tengan una llave que viene en data, buscándolas en un set, y los que se repiten entre sí
+            # salvo el último, igual que drop_duplicates(keep='last') sobre todos los registros juntos
+            data = data.drop_duplicates(subset=drop_duplicates, keep='last')
+            if set(drop_duplicates).issubset(current_data.columns):
+                new_keys = set(data[drop_duplicates].itertuples(index=False, name=None))
+                repeated[:] = [key in new_keys for key in current_data[drop_duplicates].itertuples(index=False, name=None)]
+                repeated |= current_data.duplicated(subset=drop_duplicates, keep='last')
+
+            # Si ningún registro actual sobra, los nuevos solo se agregan al final
+            if columns_exist and not repeated.any():
+                return self.__append_rows(data)
 
         new_data = (
             pd
-            .concat((current_data, data), ignore_index=True)
-            .replace({np.NaN:None})
+            .concat((current_data[~repeated], data), ignore_index=True)
         )
 
-        if drop_duplicates is not None:
-            new_data.drop_duplicates(subset=drop_duplicates, inplace=True, keep='last')
-
         self.write_dataframe(new_data, index)
-        
 
-    
     def modify_record(self, id:dict, values:dict) -> None:
         '''
         Esta función modifica los registros que hagan match con el id especificado.
@@ -173,20 +442,157 @@ class SheetsFunctions:
             values={'apellido':'alcaraz', 'sexo':'h'}
         )
         ''' 
-        # Primero hacemos el query para buscar el registro
-        query = ' and '.join([f"{col_name} == '{value}'" if isinstance(value, str) else f"{col_name} == {value}" for col_name, value in id.items()])
+        if self.__buffer is not None: return self.__modify_buffer(id, values)
+
+        for attempt in range(3):
+            # Leemos y filtramos los valores con una máscara por columna, sin armar un query de texto
+            df = self.__get_records()
+            mask = pd.Series(True, index=df.index)
+            for col_name, value in id.items():
+                mask &= df[col_name] == value
+            index = df.index[mask]
+
+            # Si alguna columna no existe hay que agregarla, así que se reescribe la tabla completa
+            if not set(values).issubset(df.columns):
+                for col_name, value in values.items():
+                    df.loc[index, col_name] = value
+                self.write_dataframe(df, False)
+                return
+
+            # Si no, solo se mandan las celdas que cambian, todas en una sola llamada.
+            # La fila 1 es el header, así que el registro i está en la fila i + 2
+            positions = [df.index.get_loc(i) + 2 for i in index]
+            if not positions: return
+
+            # Antes de escribir se revisa que nadie haya cambiado esas filas desde que se leyeron;
+            # si cambiaron se vuelve a leer la hoja y se intenta de nuevo
+            if self.__rows_unchanged(positions):
+                payload = [
+                    {'range': gspread.utils.rowcol_to_a1(row, df.columns.get_loc(col_name) + 1), 'values': [[self.__to_cell(value)]]}
+                    for col_name, value in values.items()
+                    for row in positions
+                ]
+                self.__ws.batch_update(payload, value_input_option='RAW')
+                self.__values_cache = None
+                self.__last_write_hash = None
+                return
+
+            self.__values_cache = None
+            time.sleep(random.uniform(0.1, 0.5) * 2 ** attempt)
+
+        raise RuntimeError('The rows to modify kept changing while trying to update them')
+
+    def __enter__(self):
+        '''
+        Dentro de un bloque with, modify_record solo cambia una copia local de la hoja y las celdas
+        cambiadas se escriben juntas, en una sola llamada, al salir del bloque (o con flush()).
+        Si hay una excepción dentro del bloque, los cambios pendientes no se escriben.
+
+        Eg.
+        with sheets:
+            sheets.modify_record({'name':'mariano'}, {'edad':23})
+            sheets.modify_record({'name':'ana'}, {'edad':30})
+        '''
+        self.__pending = []
+        self.__load_buffer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None: self.flush()
+        finally:
+            self.__buffer = None
+            self.__buffer_values = None
+            self.__pending = []
+            self.__dirty = {}
+
+    def __load_buffer(self) -> None:
+        '''
+        Lee la hoja completa al buffer y le vuelve a aplicar los cambios pendientes.
+        '''
+        self.__values_cache = None
+        self.__buffer = self.__get_records()
+        self.__buffer_values = self.__get_values()
+        self.__dirty = {}
+        for id, values in self.__pending:
+            self.__apply_to_buffer(id, values)
+
+    def flush(self) -> None:
+        '''
+        Escribe en una sola llamada las celdas que se han cambiado dentro del bloque with.
 
-        # Leemos y filtramos los valores
-        df = pd.DataFrame(self.__ws.get_all_records())
-        record = df.query(query)
-        index = record.index
+        Antes de escribir se revisa que nadie haya cambiado esas filas desde que se leyó la hoja;
+        si cambiaron se vuelve a leer y se repiten los cambios sobre la lectura nueva, como en modify_record.
+        '''
+        for attempt in range(3):
+            if not self.__dirty: return
+
+            if self.__rows_unchanged(sorted({row for row, _ in self.__dirty}), self.__buffer_values):
+                payload = [
+                    {'range': gspread.utils.rowcol_to_a1(row, column), 'values': [[self.__to_cell(value)]]}
+                    for (row, column), value in self.__dirty.items()
+                ]
+                self.__ws.batch_update(payload, value_input_option='RAW')
+                self.__dirty = {}
+                self.__pending = []
+                self.__buffer_values = None # La siguiente modificación vuelve a leer la hoja
+                self.__header = None
+                self.__values_cache = None
+                self.__last_write_hash = None
+                return
+
+            time.sleep(random.uniform(0.1, 0.5) * 2 ** attempt)
+            self.__load_buffer()
+
+        raise RuntimeError('The rows to modify kept changing while trying to update them')
+
+    def __modify_buffer(self, id:dict, values:dict) -> None:
+        '''
+        modify_record dentro de un bloque with: cambia el buffer y anota las celdas que cambiaron.
+        Si una celda se cambia varias veces solo se escribe el último valor.
+        '''
+        if self.__buffer_values is None: self.__load_buffer()
+        self.__pending.append((id, values))
+        self.__apply_to_buffer(id, values)
+
+    def __apply_to_buffer(self, id:dict, values:dict) -> None:
+        '''Cambia los registros del buffer que hagan match con id y anota las celdas que cambiaron'''
+        df = self.__buffer
+        mask = pd.Series(True, index=df.index)
+        for col_name, value in id.items():
+            mask &= df[col_name] == value
+        index = df.index[mask]
 
-        # Cambiamos los valores
         for col_name, value in values.items():
+            if col_name not in df.columns:
+                df[col_name] = ''
+                self.__dirty[(1, len(df.columns))] = col_name
+            column = df.columns.get_loc(col_name) + 1
             df.loc[index, col_name] = value
+            for i in index:
+                self.__dirty[(df.index.get_loc(i) + 2, column)] = value
 
-        # Guardamos la nueva tabla
-        self.write_dataframe(df, False)
+    def __rows_unchanged(self, positions:list, cached_values:list=None) -> bool:
+        '''
+        Vuelve a leer solo las filas dadas (en una sola llamada) y revisa que sean iguales a las
+        de la última lectura guardada de la hoja.
+
+        :param positions: números de fila en la hoja (la 1 es el header)
+        :param cached_values: lectura contra la que se compara; por defecto la última guardada
+        '''
+        if cached_values is None: cached_values = self.__get_values()
+        fresh_rows = self.__ws.batch_get(
+            [f'{row}:{row}' for row in positions],
+            value_render_option='UNFORMATTED_VALUE',
+            date_time_render_option='FORMATTED_STRING'
+        )
+        for row, fresh in zip(positions, fresh_rows):
+            cached = list(cached_values[row - 1]) if row <= len(cached_values) else []
+            fresh = list(fresh[0]) if fresh else []
+            # get_values rellena con '' hasta el ancho de la hoja; batch_get no
+            while cached and cached[-1] == '': cached.pop()
+            if cached != fresh: return False
+        return True
 
 
     
@@ -0,0 +1,79 @@
+import time
+import unittest
+from unittest import mock
+
+import orjson
+import pandas as pd
+import requests
+
+from sf_connection import SalesforceConnection, _read_bulk_page
+
+
+def _response(status_code:int, body:bytes=b'') -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    return response
+
+
+class UpdateRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.sfc = SalesforceConnection({'session_id': 'token', 'instance': 'test.my.salesforce.com'})
+        self.session = self.sfc._SalesforceConnection__sf.session
+
+    def test_returns_204_on_empty_patch_response(self):
+        with mock.patch.object(self.session, 'request', return_value=_response(204)) as request:
+            status = self.sfc.update_record('Account', '001000000000001', {'Phone': '555'})
+
+        self.assertEqual(status, 204)
+        method, url = request.call_args.args
+        self.assertEqual(method, 'PATCH')
+        self.assertTrue(url.endswith('sobjects/Account/001000000000001'))
+
+
+class UpdateRecordsTest(unittest.TestCase):
+    def setUp(self):
+        self.sfc = SalesforceConnection({'session_id': 'token', 'instance': 'test.my.salesforce.com'})
+        self.session = self.sfc._SalesforceConnection__sf.session
+
+    def test_nan_is_left_unchanged_and_none_clears_the_field(self):
+        body = orjson.dumps([{'id': '001000000000001', 'success': True, 'errors': []}])
+        with mock.patch.object(self.session, 'request', return_value=_response(200, body)) as request:
+            self.sfc.update_records('Account', [{'Id': '001000000000001', 'Phone': float('nan'), 'Fax': None}])
+
+        record = orjson.loads(request.call_args.kwargs['data'])['records'][0]
+        self.assertNotIn('Phone', record)
+        self.assertIn('Fax', record)
+        self.assertIsNone(record['Fax'])
+
+
+class ReadBulkPageTest(unittest.TestCase):
+    def test_keeps_leading_zeros_and_empty_cells_as_nan(self):
+        df = _read_bulk_page('"Id","Zip","Phone"\n"001","01234",""\n')
+
+        self.assertEqual(df.loc[0, 'Id'], '001')
+        self.assertEqual(df.loc[0, 'Zip'], '01234')
+        self.assertTrue(pd.isna(df.loc[0, 'Phone']))
+
+
+class FindInvalidRowsTest(unittest.TestCase):
+    def setUp(self):
+        self.sfc = SalesforceConnection({'session_id': 'token', 'instance': 'test.my.salesforce.com'})
+        fields = [
+            {'name': 'Name', 'type': 'string', 'nillable': False, 'createable': True, 'updateable': True, 'defaultedOnCreate': False},
+            {'name': 'Phone', 'type': 'phone', 'nillable': True, 'createable': True, 'updateable': True, 'defaultedOnCreate': False},
+        ]
+        self.sfc._SalesforceConnection__describe_cache['Account'] = (time.monotonic(), {'fields': fields})
+        self.df = pd.DataFrame({'Name': [None, 'Acme'], 'Phone': ['555', None]}, index=['001A', '001B'])
+
+    def test_blank_required_field_is_valid_when_updating(self):
+        invalid = self.sfc.find_invalid_rows('Account', self.df, creating=False)
+        self.assertEqual(invalid.tolist(), [False, False])
+
+    def test_blank_required_field_is_invalid_when_creating(self):
+        invalid = self.sfc.find_invalid_rows('Account', self.df, creating=True)
+        self.assertEqual(invalid.tolist(), [True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()